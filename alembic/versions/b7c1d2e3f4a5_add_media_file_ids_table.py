@@ -0,0 +1,48 @@
+"""Add media_file_ids table caching Telegram file_id per canonical media link
+
+Revision ID: b7c1d2e3f4a5
+Revises: a1b2c3d4e5f6
+Create Date: 2026-10-17 00:00:00
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "b7c1d2e3f4a5"
+down_revision = "a1b2c3d4e5f6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_file_ids",
+        sa.Column("link_key", sa.String(length=512), primary_key=True),
+        sa.Column("file_id", sa.Text(), nullable=False),
+        sa.Column("media_type", sa.String(length=16), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.Column(
+            "last_used_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+    op.create_index(
+        "idx_media_file_ids_last_used_at",
+        "media_file_ids",
+        ["last_used_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_media_file_ids_last_used_at", table_name="media_file_ids")
+    op.drop_table("media_file_ids")
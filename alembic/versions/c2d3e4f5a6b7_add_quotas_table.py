@@ -0,0 +1,34 @@
+"""Add quotas table for shared provider request counters
+
+Revision ID: c2d3e4f5a6b7
+Revises: b7c1d2e3f4a5
+Create Date: 2026-10-17 00:00:00
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "c2d3e4f5a6b7"
+down_revision = "b7c1d2e3f4a5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "quotas",
+        sa.Column("key", sa.String(length=64), primary_key=True),
+        sa.Column("remaining", sa.Integer(), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("quotas")
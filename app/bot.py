@@ -11,6 +11,7 @@ from telegram.ext import (
     Application,
     CallbackQueryHandler,
     CommandHandler,
+    ContextTypes,
     MessageHandler,
     filters,
 )
@@ -26,12 +27,31 @@ from app.handlers import (
     handle_feature_command,
     handle_feature_media,
     handle_message,
+    handle_stats_command,
     log_unknown_callback,
 )
+from app.media_retry import start_media_retries
+from app.media_workers import close_media_workers, init_media_workers
 from services.database import close_database, init_database
+from services.media.http import close_http_client, init_http_client
+from services.usage import close_quota_store
+from services.media.file_ids import file_id_cache
 from utils.settings import get_settings
 
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MEDIA_FILE_ID_PRUNE_INTERVAL = 6 * 60 * 60
+
+
+async def _prune_media_file_ids(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Периодически удаляет давно не использованные file_id медиа.
+
+    :param context: контекст PTB (не используется напрямую)
+    :return: None
+    """
+    del context
+    await file_id_cache.prune(get_settings().media_file_id_ttl_days)
 
 
 async def _post_init(application: Application) -> None:
@@ -41,6 +61,20 @@ async def _post_init(application: Application) -> None:
     :return: None
     """
     await init_database()
+    await init_http_client()
+    await init_media_workers()
+    if application.job_queue:
+        application.job_queue.run_repeating(
+            _prune_media_file_ids, interval=MEDIA_FILE_ID_PRUNE_INTERVAL, first=60
+        )
+        start_media_retries(application.job_queue)
+    else:
+        # Без job queue старые file_id никогда не удаляются, а упавшие ссылки
+        # не повторяются (schedule_media_retry тогда ничего не ставит).
+        logger.error(
+            "JobQueue is unavailable (install python-telegram-bot[job-queue]); "
+            "media_file_ids will not be pruned and failed downloads will not be retried"
+        )
     try:
         commands = [
             BotCommand("group", "Меню управления группами"),
@@ -59,13 +93,27 @@ async def _post_init(application: Application) -> None:
         logging.exception("Failed to set bot commands: %s", exc)
 
 
+async def _post_stop(application: Application) -> None:
+    """Дожидается очереди загрузок медиа, пока бот ещё может отправлять сообщения.
+
+    :param application: экземпляр приложения PTB (не используется напрямую)
+    :return: None
+    """
+    del application
+    await close_media_workers()
+
+
 async def _post_shutdown(application: Application) -> None:
-    """Закрытие подключения к БД при остановке бота.
+    """Остановка воркеров медиа, закрытие HTTP-клиента, сброс квот и закрытие БД.
 
     :param application: экземпляр приложения PTB (не используется напрямую)
     :return: None
     """
     del application
+    # Обычно очередь уже разобрана в _post_stop; здесь — на случай, если stop не вызывался.
+    await close_media_workers()
+    await close_http_client()
+    await close_quota_store()
     await close_database()
 
 
@@ -79,6 +127,7 @@ def build_application() -> Application:
         Application.builder()
         .token(settings.telegram_bot_token)
         .post_init(_post_init)
+        .post_stop(_post_stop)
         .post_shutdown(_post_shutdown)
         .build()
     )
@@ -86,6 +135,7 @@ def build_application() -> Application:
     application.add_handler(build_say_conversation_handler())
     application.add_handler(CommandHandler("bug", handle_bug_command))
     application.add_handler(CommandHandler("feature", handle_feature_command))
+    application.add_handler(CommandHandler("stats", handle_stats_command))
     application.add_handler(MessageHandler(
         filters.CaptionRegex(r"^/bug") & (filters.PHOTO | filters.VIDEO),
         handle_bug_media,
@@ -2,7 +2,7 @@ import logging
 import math
 import re
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.error import ChatMigrated
 from telegram.ext import (
     CommandHandler,
@@ -12,25 +12,39 @@ from telegram.ext import (
     filters,
 )
 
+from app.media import build_input_media, message_links
+from app.media_workers import get_media_workers
 from services.database import GROUP_NAME_PATTERN, get_database
 from services.gemini import generate_gemini_reply
-from services.media.instagram import downloadInstagram
-from services.media.tiktok import downloadTikTok, findLink
+from services.media.cache import media_cache
+from services.media.file_ids import file_id_cache
+from services.media.metrics import media_metrics
+from services.media.registry import media_registry
+from services.media.scheduler import media_scheduler
+from services.media.transcode import transcoder
 from utils.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
 
+MENTION_PATTERN = re.compile(r"@(\w+)")
+
+
 async def _resolve_usernames(text: str, db) -> str:
-    """Заменяет @username упоминания в тексте на first_name из БД."""
-    mentions = re.findall(r"@(\w+)", text)
+    """Заменяет @username упоминания в тексте на first_name из БД.
+
+    Все упомянутые пользователи ищутся одним запросом, замена — одним проходом regex.
+    """
+    mentions = MENTION_PATTERN.findall(text)
     if not mentions:
         return text
-    for username in set(mentions):
-        user = await db.get_user_by_username(username)
-        if user and user.get("first_name"):
-            text = text.replace(f"@{username}", user["first_name"])
-    return text
+    users = await db.get_users_by_usernames(mentions)
+    names = {
+        username: user["first_name"] for username, user in users.items() if user.get("first_name")
+    }
+    if not names:
+        return text
+    return MENTION_PATTERN.sub(lambda match: names.get(match.group(1), match.group(0)), text)
 
 
 def _strip_md(text: str) -> str:
@@ -372,23 +386,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     db = get_database()
 
-    link = findLink(text)
-    if link is not None:
-        if "tiktok.com" in link:
-            media = await downloadTikTok(link)
-            if media:
-                await update.message.reply_video(video=media.url)
-            else:
-                await update.message.reply_text("Failed to download video.")
-        elif "instagram.com/reel/" in link or "instagram.com/p/" in link:
-            media = await downloadInstagram(link)
-            if media:
-                if media.extension == ".jpeg":
-                    await update.message.reply_photo(photo=media.url)
-                else:
-                    await update.message.reply_video(video=media.url)
-            else:
-                await update.message.reply_text("Failed to download media.")
+    await get_media_workers().submit(update.message, message_links(update.message))
 
     bot_command_trigger = f"/get_commands{bot_username}" if bot_username else "/get_commands"
     bot_pinged = _is_bot_mentioned(text, bot_name, bot_username)
@@ -510,7 +508,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(usernames)
         elif "@" in text:
             chatId = update.message.chat["id"]
-            mentions = set(re.findall(r"@(\w+)", text))
+            mentions = set(MENTION_PATTERN.findall(text))
             mentions.discard("all")
             if mentions:
                 members_by_group = await db.get_group_members_by_names(
@@ -1328,13 +1326,9 @@ async def _send_feedback_to_admin(
             else:
                 await bot.send_video(chat_id=admin_id, video=item["file_id"], caption=header)
         elif media and len(media) > 1:
-            input_media = []
-            for i, item in enumerate(media):
-                caption = header if i == 0 else None
-                if item["type"] == "photo":
-                    input_media.append(InputMediaPhoto(media=item["file_id"], caption=caption))
-                else:
-                    input_media.append(InputMediaVideo(media=item["file_id"], caption=caption))
+            input_media = build_input_media(
+                [(item["type"], item["file_id"]) for item in media], caption=header
+            )
             await bot.send_media_group(chat_id=admin_id, media=input_media)
         else:
             await bot.send_message(chat_id=admin_id, text=header)
@@ -1421,6 +1415,45 @@ async def handle_feature_media(update: Update, context: ContextTypes.DEFAULT_TYP
     await _handle_feedback(update, context, "feature")
 
 
+def _format_stats(title: str, stats: dict) -> list[str]:
+    """Форматирует словарь счётчиков в строки для /stats."""
+    lines = [title]
+    for name, values in stats.items():
+        if isinstance(values, dict):
+            details = ", ".join(f"{key}={value}" for key, value in values.items())
+            lines.append(f"  {name}: {details}")
+        else:
+            lines.append(f"  {name}: {values}")
+    return lines
+
+
+async def handle_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/stats: служебная статистика медиа-пайплайна, доступна только администратору.
+
+    :param update: Update команды
+    :param context: контекст PTB (не используется напрямую)
+    :return: None
+    """
+    del context
+    settings = get_settings()
+    user = update.effective_user
+    if not settings.admin_user_id or not user or user.id != settings.admin_user_id:
+        return
+
+    lines = _format_stats("Очереди провайдеров:", media_scheduler.stats() or {"—": "пусто"})
+    lines += _format_stats("Здоровье провайдеров:", media_registry.stats() or {"—": "пусто"})
+    lines += _format_stats("Воркеры медиа:", {"pool": get_media_workers().stats()})
+    if transcoder is not None:
+        lines += _format_stats("Транскодирование:", {"ffmpeg": transcoder.stats()})
+    lines += _format_stats("Метрики провайдеров:", media_metrics.stats() or {"—": "пусто"})
+    lines += _format_stats(
+        "Кэши медиа:",
+        {"media": media_cache.stats(), "file_id": file_id_cache.stats()},
+    )
+    lines += _format_stats("Кэши БД:", get_database().cache_stats())
+    await update.message.reply_text("\n".join(lines))
+
+
 def build_say_conversation_handler():
     return ConversationHandler(
         entry_points=[CommandHandler("say", say_start)],
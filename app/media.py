@@ -0,0 +1,432 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Optional, Protocol
+
+from telegram import InputFile, InputMediaPhoto, InputMediaVideo, Message, MessageEntity
+from telegram.error import BadRequest
+
+from services.media.base import MediaInfo, ProviderError
+from services.media.file_ids import file_id_cache
+from services.media.links import (
+    INSTAGRAM,
+    TIKTOK,
+    MediaKey,
+    canonicalize,
+    detect_provider,
+    extract_links,
+    unresolved_media_key,
+)
+from services.media.registry import media_registry
+from services.media.reupload import MediaFetchError, MediaTooLarge, spooled_download
+from services.media.scheduler import SchedulerRejected
+from services.media.transcode import TranscodeError, transcoder
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+MEDIA_GROUP_LIMIT = 10
+BUSY_TEXT = "Too many download requests right now, please try again in a minute."
+RETRY_TEXT = "The download service is unavailable right now, I will retry this link later."
+# Uploading up to 50 MB ourselves takes far longer than the default write timeout.
+REUPLOAD_WRITE_TIMEOUT = 120
+# BadRequest texts meaning Telegram could not fetch the media itself: a URL it
+# cannot download or a file_id it no longer accepts. Any other BadRequest
+# (deleted message, bad caption) would fail the same way after a re-upload.
+MEDIA_FETCH_ERRORS = (
+    "failed to get http url content",
+    "wrong file identifier/http url specified",
+    "wrong remote file identifier specified",
+    "wrong type of the web page content",
+)
+
+FAILURE_TEXTS = {
+    TIKTOK: "Failed to download video.",
+    INSTAGRAM: "Failed to download media.",
+}
+
+
+class Progress(Protocol):
+    """Callback, которому send_media_links сообщает о ходе загрузки."""
+
+    def __call__(self, text: str, force: bool = False) -> Awaitable[None]: ...
+
+
+class RetryHook(Protocol):
+    """Callback, который ставит ссылку с временной ошибкой на повтор (True, если поставил)."""
+
+    def __call__(self, message: Message, link: str, error: str) -> Awaitable[bool]: ...
+
+
+@dataclass
+class ResolvedMedia:
+    """Готовое к отправке медиа: URL провайдера или сохранённый file_id."""
+
+    key: MediaKey
+    media_type: str
+    media: str
+    from_cache: bool = False
+    # file_id кэшируется по ключу поста, поэтому только для постов из одного медиа.
+    cacheable: bool = True
+
+
+@dataclass
+class LinkResult:
+    """Итог обработки одной ссылки сообщения."""
+
+    # None для неподдерживаемой ссылки или платформы без провайдера.
+    media_key: Optional[MediaKey] = None
+    items: Optional[list[ResolvedMedia]] = None
+    failure_text: Optional[str] = None
+    # Текст временной ошибки (5xx, 429, переполненная очередь): ссылку стоит повторить.
+    retry_error: Optional[str] = None
+
+
+def message_links(message: Message) -> list[str]:
+    """Возвращает все поддерживаемые ссылки сообщения (сначала по entities Telegram).
+
+    :param message: входящее сообщение
+    :return: список ссылок TikTok/Instagram в порядке появления
+    """
+    entities = message.parse_entities([MessageEntity.URL, MessageEntity.TEXT_LINK])
+    entity_urls = [
+        entity.url if entity.type == MessageEntity.TEXT_LINK else value
+        for entity, value in entities.items()
+    ]
+    return extract_links(message.text or "", entity_urls)
+
+
+def build_input_media(items: list[tuple[str, str]], caption: Optional[str] = None) -> list:
+    """Собирает InputMediaPhoto/InputMediaVideo для send_media_group.
+
+    :param items: пары (тип "photo"/"video", file_id или URL)
+    :param caption: подпись первого элемента
+    :return: список InputMedia
+    """
+    input_media = []
+    for i, (media_type, media) in enumerate(items):
+        item_caption = caption if i == 0 else None
+        if media_type == "photo":
+            input_media.append(InputMediaPhoto(media=media, caption=item_caption))
+        else:
+            input_media.append(InputMediaVideo(media=media, caption=item_caption))
+    return input_media
+
+
+def _media_type(media: MediaInfo) -> str:
+    return "photo" if media.extension == ".jpeg" else "video"
+
+
+async def _reply_media(message: Message, media, media_type: str, **kwargs) -> Message:
+    """Отправляет фото/видео ответом на сообщение (по URL, file_id или файлом)."""
+    if media_type == "photo":
+        return await message.reply_photo(photo=media, **kwargs)
+    return await message.reply_video(video=media, **kwargs)
+
+
+def _sent_file_id(sent: Message, media_type: str) -> Optional[str]:
+    """Достаёт file_id из отправленного сообщения."""
+    if media_type == "photo" and sent.photo:
+        return sent.photo[-1].file_id
+    if media_type == "video" and sent.video:
+        return sent.video.file_id
+    if sent.animation:
+        return sent.animation.file_id
+    return None
+
+
+async def _download(
+    media_key: MediaKey, chat_id: Optional[int]
+) -> Optional[list[ResolvedMedia]]:
+    """Запрашивает все медиа поста у провайдера в обход кэша file_id."""
+    items = await media_registry.download(media_key.url, chat_id, media_key)
+    if not items:
+        return None
+    return [
+        ResolvedMedia(
+            key=media_key,
+            media_type=_media_type(media),
+            media=media.url,
+            cacheable=len(items) == 1,
+        )
+        for media in items
+    ]
+
+
+def link_enabled(link: str) -> bool:
+    """Проверяет, настроен ли провайдер для платформы ссылки.
+
+    :param link: ссылка из сообщения
+    :return: True, если ссылку есть кому скачать
+    """
+    platform = detect_provider(link)
+    return platform is not None and media_registry.enabled(platform)
+
+
+async def resolve_link(
+    link: str, chat_id: Optional[int], semaphore: asyncio.Semaphore
+) -> LinkResult:
+    """Канонизирует ссылку и находит для неё file_id или URL провайдера.
+
+    :param link: ссылка из сообщения
+    :param chat_id: чат, из которого пришёл запрос (для честной очереди)
+    :param semaphore: ограничение параллельности в рамках одного сообщения
+    :return: LinkResult с медиа поста или текстом ошибки
+    """
+    if not link_enabled(link):
+        # Платформа без настроенного провайдера: ссылку просто пропускаем.
+        return LinkResult()
+    async with semaphore:
+        media_key = await canonicalize(link) or unresolved_media_key(link)
+        if media_key is None:
+            return LinkResult()
+        cached = await file_id_cache.get(media_key.key)
+        if cached:
+            resolved = ResolvedMedia(
+                key=media_key,
+                media_type=cached.media_type,
+                media=cached.file_id,
+                from_cache=True,
+            )
+            return LinkResult(media_key, [resolved])
+        try:
+            resolved = await _download(media_key, chat_id)
+        except SchedulerRejected:
+            return LinkResult(media_key, failure_text=BUSY_TEXT, retry_error="provider queue is full")
+        except ProviderError as exc:
+            return LinkResult(
+                media_key, failure_text=FAILURE_TEXTS[media_key.provider], retry_error=str(exc)
+            )
+        if resolved is None:
+            return LinkResult(media_key, failure_text=FAILURE_TEXTS[media_key.provider])
+        return LinkResult(media_key, resolved)
+
+
+def _is_fetch_error(exc: BadRequest) -> bool:
+    """Проверяет, что Telegram не смог получить медиа по URL или file_id."""
+    text = exc.message.lower()
+    return any(error in text for error in MEDIA_FETCH_ERRORS)
+
+
+async def _send_chunk(message: Message, chunk: list[ResolvedMedia]) -> list[Message]:
+    """Отправляет до 10 медиа одним сообщением (или одиночным reply для одного).
+
+    :param message: сообщение, на которое отвечаем
+    :param chunk: подготовленные медиа
+    :return: отправленные сообщения в порядке chunk
+    """
+    if len(chunk) == 1:
+        item = chunk[0]
+        return [await _reply_media(message, item.media, item.media_type)]
+    return list(
+        await message.reply_media_group(
+            media=build_input_media([(item.media_type, item.media) for item in chunk])
+        )
+    )
+
+
+async def _refresh_cached(
+    chunk: list[ResolvedMedia], chat_id: Optional[int]
+) -> list[ResolvedMedia]:
+    """Сбрасывает отклонённые file_id и заново получает эти медиа у провайдера."""
+    refreshed: list[ResolvedMedia] = []
+    for item in chunk:
+        if not item.from_cache:
+            refreshed.append(item)
+            continue
+        await file_id_cache.invalidate(item.key.key)
+        try:
+            fresh = await _download(item.key, chat_id)
+        except (SchedulerRejected, ProviderError):
+            fresh = None
+        if fresh:
+            refreshed.extend(fresh)
+    return refreshed
+
+
+async def _upload_file(message: Message, item: ResolvedMedia, handle) -> Message:
+    """Отправляет открытый файл медиа ответом на сообщение."""
+    extension = ".jpg" if item.media_type == "photo" else ".mp4"
+    return await _reply_media(
+        message,
+        # The HTTP backend reads the handle while sending, so the file is
+        # never loaded into memory as a whole.
+        InputFile(handle, filename=f"{item.key.media_id}{extension}", read_file_handle=False),
+        item.media_type,
+        write_timeout=REUPLOAD_WRITE_TIMEOUT,
+    )
+
+
+async def _reupload(message: Message, item: ResolvedMedia) -> Message:
+    """Скачивает медиа сами и загружает его в Telegram файлом.
+
+    Видео больше лимита загрузки перекодируется через ffmpeg, если оно включено.
+
+    :param message: сообщение, на которое отвечаем
+    :param item: медиа с URL провайдера
+    :return: отправленное сообщение
+    """
+    try:
+        async with spooled_download(item.media) as handle:
+            return await _upload_file(message, item, handle)
+    except MediaTooLarge:
+        if transcoder is None or item.media_type != "video":
+            raise
+        logger.info("%s is too large to upload, transcoding it", item.key.key)
+    async with transcoder.transcoded(
+        item.media, get_settings().media_reupload_max_bytes
+    ) as handle:
+        return await _upload_file(message, item, handle)
+
+
+async def _reupload_chunk(
+    message: Message, chunk: list[ResolvedMedia]
+) -> tuple[list[ResolvedMedia], list[Message]]:
+    """Перезагружает порцию медиа по одному файлу, когда Telegram не смог скачать URL.
+
+    :param message: сообщение, на которое отвечаем
+    :param chunk: медиа с URL провайдера
+    :return: (доставленные медиа, отправленные сообщения)
+    """
+    delivered: list[ResolvedMedia] = []
+    sent: list[Message] = []
+    failure_texts: list[str] = []
+    for item in chunk:
+        try:
+            sent_message = await _reupload(message, item)
+        except (MediaFetchError, TranscodeError, BadRequest) as exc:
+            logger.warning("Re-upload of %s failed: %s", item.key.key, exc)
+            failure_texts.append(FAILURE_TEXTS[item.key.provider])
+            continue
+        delivered.append(item)
+        sent.append(sent_message)
+    for failure_text in dict.fromkeys(failure_texts):
+        await message.reply_text(failure_text)
+    return delivered, sent
+
+
+async def _send_or_reupload(
+    message: Message, chunk: list[ResolvedMedia]
+) -> tuple[list[ResolvedMedia], list[Message]]:
+    """Отправляет порцию по URL, а если Telegram не смог его скачать — файлами.
+
+    Перезагрузка только для ошибок получения медиа (MEDIA_FETCH_ERRORS),
+    остальные BadRequest пробрасываются. Для порции, где есть file_id из кэша,
+    пробрасывается и ошибка получения: не понять, отклонён file_id или URL,
+    это решает _deliver_chunk.
+    """
+    try:
+        return chunk, await _send_chunk(message, chunk)
+    except BadRequest as exc:
+        if not _is_fetch_error(exc) or any(item.from_cache for item in chunk):
+            raise
+        logger.warning("Telegram could not fetch media by URL, uploading it ourselves: %s", exc)
+        return await _reupload_chunk(message, chunk)
+
+
+async def _deliver_chunk(message: Message, chunk: list[ResolvedMedia]) -> None:
+    """Отправляет порцию медиа и запоминает выданные Telegram file_id.
+
+    :param message: сообщение, на которое отвечаем
+    :param chunk: подготовленные медиа
+    :return: None
+    """
+    try:
+        chunk, sent = await _send_or_reupload(message, chunk)
+    except BadRequest as exc:
+        if not _is_fetch_error(exc):
+            raise
+        fresh = [item for item in chunk if not item.from_cache]
+        if fresh:
+            # Either the cached file_ids or the new URLs may be what Telegram
+            # rejected, so each half is sent (and recovered) on its own.
+            logger.warning("Mixed media group was rejected, sending cached media apart: %s", exc)
+            await _deliver_chunk(message, [item for item in chunk if item.from_cache])
+            await _deliver_chunk(message, fresh)
+            return
+        logger.warning("Cached file_id was rejected, downloading again: %s", exc)
+        chunk = await _refresh_cached(chunk, message.chat_id)
+        if not chunk:
+            return
+        chunk, sent = await _send_or_reupload(message, chunk)
+
+    for item, sent_message in zip(chunk, sent):
+        if item.from_cache or not item.cacheable:
+            continue
+        file_id = _sent_file_id(sent_message, item.media_type)
+        if file_id:
+            await file_id_cache.save(item.key.key, file_id, item.media_type)
+
+
+async def deliver_media(message: Message, resolved: list[ResolvedMedia]) -> None:
+    """Отправляет медиа ответом на сообщение порциями по MEDIA_GROUP_LIMIT.
+
+    :param message: сообщение, на которое отвечаем
+    :param resolved: подготовленные медиа
+    :return: None
+    """
+    for start in range(0, len(resolved), MEDIA_GROUP_LIMIT):
+        await _deliver_chunk(message, resolved[start : start + MEDIA_GROUP_LIMIT])
+
+
+async def send_media_links(
+    message: Message,
+    links: list[str],
+    progress: Optional[Progress] = None,
+    retry: Optional[RetryHook] = None,
+) -> None:
+    """Параллельно получает медиа по всем ссылкам и отправляет их медиагруппами.
+
+    :param message: сообщение со ссылками, на которое отвечаем
+    :param links: ссылки на TikTok/Instagram (в том числе короткие)
+    :param progress: необязательный callback для текста о ходе загрузки
+    :param retry: необязательный callback, откладывающий ссылки с временной ошибкой
+    :return: None
+    """
+    if not links:
+        return
+    semaphore = asyncio.Semaphore(max(get_settings().media_links_concurrency, 1))
+    done = 0
+
+    async def resolve(link: str):
+        nonlocal done
+        result = await resolve_link(link, message.chat_id, semaphore)
+        done += 1
+        if progress:
+            await progress(f"Fetched {done}/{len(links)} link(s)…")
+        return result
+
+    results = await asyncio.gather(*(resolve(link) for link in links))
+
+    resolved: list[ResolvedMedia] = []
+    failure_texts: list[str] = []
+    seen_keys: set[str] = set()
+    for result in results:
+        media_key = result.media_key
+        if media_key is None or media_key.key in seen_keys:
+            continue
+        seen_keys.add(media_key.key)
+        if result.items is None:
+            if (
+                result.retry_error
+                and retry is not None
+                and await retry(message, media_key.url, result.retry_error)
+            ):
+                failure_texts.append(RETRY_TEXT)
+            else:
+                failure_texts.append(result.failure_text)
+            continue
+        resolved.extend(result.items)
+    logger.info(
+        "Message %s: %d links, %d posts resolved into %d media items",
+        message.message_id,
+        len(links),
+        len(seen_keys) - len(failure_texts),
+        len(resolved),
+    )
+
+    if progress and resolved:
+        await progress(f"Sending {len(resolved)} file(s)…", force=True)
+    await deliver_media(message, resolved)
+    for failure_text in dict.fromkeys(failure_texts):
+        await message.reply_text(failure_text)
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from telegram import Bot, Chat, Message
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes, JobQueue
+
+from app.media import FAILURE_TEXTS, deliver_media, resolve_link
+from services.database import get_database
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Claimed retries are hidden from other runs for this long; one retry never takes longer.
+MEDIA_RETRY_LEASE = 10 * 60
+
+# Повторы ставятся в очередь только если их есть кому выполнить.
+_runner_scheduled = False
+
+
+def retry_delay(attempts: int) -> float:
+    """Задержка перед следующей попыткой: base * 2^attempts, не больше max.
+
+    :param attempts: сколько повторов уже было
+    :return: задержка в секундах
+    """
+    settings = get_settings()
+    return min(
+        settings.media_retry_base_delay * 2 ** min(attempts, 32), settings.media_retry_max_delay
+    )
+
+
+async def schedule_media_retry(message: Message, link: str, error: str) -> bool:
+    """Сохраняет ссылку с временной ошибкой для повторной загрузки.
+
+    :param message: исходное сообщение, на которое потом ответим
+    :param link: каноническая ссылка на медиа
+    :param error: текст ошибки
+    :return: True, если ссылка поставлена на повтор
+    """
+    if not _runner_scheduled or get_settings().media_retry_max_attempts <= 0:
+        return False
+    scheduled = await get_database().add_media_retry(
+        message.chat_id, message.message_id, link, retry_delay(0), error
+    )
+    if scheduled:
+        logger.info("Scheduled retry of %s for message %s: %s", link, message.message_id, error)
+    return scheduled
+
+
+def _original_message(bot: Bot, chat_id: int, message_id: int) -> Message:
+    """Восстанавливает исходное сообщение ровно настолько, чтобы на него ответить."""
+    chat_type = Chat.PRIVATE if chat_id > 0 else Chat.SUPERGROUP
+    message = Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=chat_id, type=chat_type),
+    )
+    message.set_bot(bot)
+    return message
+
+
+async def _retry(bot: Bot, row: dict) -> None:
+    """Одна повторная попытка: доставить медиа, отложить ещё раз или сдаться."""
+    db = get_database()
+    message = _original_message(bot, row["chat_id"], row["message_id"])
+    result = await resolve_link(row["link"], row["chat_id"], asyncio.Semaphore(1))
+    attempts = row["attempts"] + 1
+    if result.items:
+        await deliver_media(message, result.items)
+        logger.info("Retry %d of %s succeeded", attempts, row["link"])
+    elif result.retry_error and attempts < get_settings().media_retry_max_attempts:
+        await db.reschedule_media_retry(row["id"], retry_delay(attempts), result.retry_error)
+        logger.info("Retry %d of %s failed again: %s", attempts, row["link"], result.retry_error)
+        return
+    elif result.media_key is not None:
+        logger.warning("Giving up on %s after %d retries", row["link"], attempts)
+        await message.reply_text(FAILURE_TEXTS[result.media_key.provider])
+    await db.delete_media_retry(row["id"])
+
+
+async def run_media_retries(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Периодически повторяет загрузки, упавшие из-за временных ошибок.
+
+    За запуск берётся не больше MEDIA_RETRY_BATCH ссылок и только когда
+    очередь загрузок пуста, чтобы повторы не задерживали новые запросы.
+
+    :param context: контекст PTB (нужен бот для ответов)
+    :return: None
+    """
+    # Импорт здесь: воркеры сами зависят от этого модуля (schedule_media_retry).
+    from app.media_workers import get_media_workers
+
+    if get_media_workers().busy:
+        return
+    settings = get_settings()
+    rows = await get_database().claim_media_retries(settings.media_retry_batch, MEDIA_RETRY_LEASE)
+    for row in rows:
+        if get_media_workers().busy:
+            # Отложенные строки вернутся сами, когда истечёт аренда.
+            break
+        try:
+            await _retry(context.bot, row)
+        except TelegramError as exc:
+            # Исходное сообщение удалено или бот больше не в чате — отвечать некуда.
+            logger.warning("Dropping retry of %s: %s", row["link"], exc)
+            await get_database().delete_media_retry(row["id"])
+
+
+def start_media_retries(job_queue: JobQueue) -> None:
+    """Регистрирует run_media_retries в job queue и разрешает ставить повторы.
+
+    :param job_queue: job queue приложения
+    :return: None
+    """
+    global _runner_scheduled
+    job_queue.run_repeating(
+        run_media_retries, interval=get_settings().media_retry_interval, first=30
+    )
+    _runner_scheduled = True
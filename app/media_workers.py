@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from telegram import Message
+from telegram.error import TelegramError
+
+from app.media import BUSY_TEXT, link_enabled, send_media_links
+from app.media_retry import schedule_media_retry
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Telegram throttles message edits; one edit per second per placeholder is safe.
+PROGRESS_EDIT_INTERVAL = 1.0
+# Jobs served from the file_id cache finish well within this; only slower ones
+# get a placeholder.
+PROGRESS_DELAY = 2.0
+
+
+@dataclass
+class MediaJob:
+    """Ссылки из одного сообщения, ожидающие загрузки."""
+
+    message: Message
+    links: list[str]
+
+
+class PlaceholderProgress:
+    """Показывает прогресс задачи, редактируя одно служебное сообщение.
+
+    Сообщение отправляется только если задача идёт дольше ``delay`` секунд.
+    """
+
+    def __init__(self, message: Message, delay: float = PROGRESS_DELAY) -> None:
+        self._message = message
+        self._delay = delay
+        self._placeholder: Optional[Message] = None
+        self._pending: Optional[asyncio.Task] = None
+        self._posting = False
+        self._text = ""
+        self._edited_at = 0.0
+
+    def start(self, text: str) -> None:
+        self._text = text
+        self._pending = asyncio.create_task(self._post())
+
+    async def _post(self) -> None:
+        await asyncio.sleep(self._delay)
+        self._posting = True
+        try:
+            self._placeholder = await self._message.reply_text(self._text)
+        except TelegramError as exc:
+            logger.warning("Failed to send progress placeholder: %s", exc)
+            return
+        self._edited_at = time.monotonic()
+
+    async def __call__(self, text: str, force: bool = False) -> None:
+        if self._placeholder is None:
+            # Not posted yet: the placeholder will show the latest text.
+            if not self._posting:
+                self._text = text
+            return
+        if text == self._text:
+            return
+        if not force and time.monotonic() - self._edited_at < PROGRESS_EDIT_INTERVAL:
+            return
+        try:
+            await self._placeholder.edit_text(text)
+        except TelegramError as exc:
+            logger.debug("Failed to update progress placeholder: %s", exc)
+            return
+        self._text = text
+        self._edited_at = time.monotonic()
+
+    async def finish(self) -> None:
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            # A placeholder that is being sent right now is awaited and deleted.
+            if not self._posting:
+                pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        placeholder, self._placeholder = self._placeholder, None
+        if placeholder is None:
+            return
+        try:
+            await placeholder.delete()
+        except TelegramError as exc:
+            logger.debug("Failed to delete progress placeholder: %s", exc)
+
+
+class MediaWorkerPool:
+    """Ограниченная очередь загрузок медиа и N фоновых воркеров.
+
+    Обработчик сообщений только ставит задачу в очередь. Если очередь
+    заполнена, постановка ждёт до ``put_timeout`` секунд, после чего
+    пользователь получает ответ «попробуйте позже».
+    """
+
+    def __init__(self, workers: int, max_size: int, put_timeout: float) -> None:
+        self.workers = max(workers, 1)
+        self.put_timeout = put_timeout
+        self._queue: "asyncio.Queue[MediaJob]" = asyncio.Queue(maxsize=max(max_size, 1))
+        self._tasks: list[asyncio.Task] = []
+        self._closed = False
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._closed = False
+        # Обычные задачи asyncio, а не application.create_task: Application.stop()
+        # ждёт свои задачи, а воркеры бесконечны и останавливаются через stop().
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"media-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    @property
+    def busy(self) -> bool:
+        """Есть задачи в очереди или заняты все воркеры."""
+        return self._queue.qsize() > 0 or self.active >= self.workers
+
+    async def submit(self, message: Message, links: list[str]) -> bool:
+        """Ставит ссылки сообщения в очередь.
+
+        :param message: сообщение со ссылками
+        :param links: поддерживаемые ссылки из сообщения
+        :return: True, если задача принята
+        """
+        if not links:
+            return True
+        if self._closed or not self._tasks:
+            self.rejected += 1
+            await message.reply_text(BUSY_TEXT)
+            return False
+        try:
+            await asyncio.wait_for(self._queue.put(MediaJob(message, links)), self.put_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Media queue is full, rejecting message %s", message.message_id)
+            await message.reply_text(BUSY_TEXT)
+            return False
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            self.active += 1
+            try:
+                await self._process(job)
+                self.processed += 1
+            except Exception as exc:  # pragma: no cover
+                self.failed += 1
+                logger.exception("Media job for message %s failed: %s", job.message.message_id, exc)
+            finally:
+                self.active -= 1
+                self._queue.task_done()
+
+    async def _process(self, job: MediaJob) -> None:
+        if not any(link_enabled(link) for link in job.links):
+            # No provider for any of the platforms: the links are skipped anyway.
+            return
+        progress = PlaceholderProgress(job.message)
+        progress.start(f"Downloading {len(job.links)} link(s)…")
+        try:
+            await send_media_links(
+                job.message, job.links, progress=progress, retry=schedule_media_retry
+            )
+        finally:
+            await progress.finish()
+
+    async def stop(self, timeout: float) -> None:
+        """Перестаёт принимать задачи, дожидается очереди (не дольше timeout) и гасит воркеры."""
+        self._closed = True
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Media queue did not drain in %.0fs, dropping %d jobs",
+                    timeout,
+                    self._queue.qsize(),
+                )
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "active": self.active,
+            "workers": len(self._tasks),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+_pool: Optional[MediaWorkerPool] = None
+
+
+def get_media_workers() -> MediaWorkerPool:
+    global _pool
+    if _pool is None:
+        settings = get_settings()
+        _pool = MediaWorkerPool(
+            settings.media_workers, settings.media_queue_size, settings.media_queue_put_timeout
+        )
+    return _pool
+
+
+async def init_media_workers() -> None:
+    get_media_workers().start()
+
+
+async def close_media_workers() -> None:
+    """Дожидается текущих загрузок и останавливает воркеры (повторный вызов безопасен)."""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.stop(get_settings().media_drain_timeout)
@@ -0,0 +1,158 @@
+"""Benchmark of the group membership writes on large groups.
+
+Creates a throwaway chat with N users in the configured database (DATABASE_*
+variables, migrations applied), then times the text commands that create a
+group, remove and re-add all its members, and the /group UI save. Everything
+it created is deleted at the end.
+
+    python scripts/bench_group_members.py --users 250 --repeat 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from services.database import close_database, get_database, init_database
+
+# Far outside real Telegram ids, so cleanup never touches real rows.
+BENCH_CHAT_ID = -1_999_999_999_999
+BENCH_USER_BASE = 1_999_999_000_000
+GROUP_NAME = "bench_group"
+
+
+async def setup(db, users: int) -> list[str]:
+    usernames = [f"bench_user_{index}" for index in range(users)]
+    user_ids = [BENCH_USER_BASE + index for index in range(users)]
+    async with db.pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO group_chats(id, title, type) VALUES(%s, 'bench', 'supergroup')"
+                " ON CONFLICT (id) DO NOTHING",
+                (BENCH_CHAT_ID,),
+            )
+            await cur.execute(
+                """
+                INSERT INTO users(id, first_name, username)
+                SELECT id, username, username FROM unnest(%s::bigint[], %s::text[]) AS t(id, username)
+                ON CONFLICT (id) DO NOTHING
+                """,
+                (user_ids, usernames),
+            )
+            await cur.execute(
+                """
+                INSERT INTO user_group_chats(user_id, group_chat_id)
+                SELECT unnest(%s::bigint[]), %s
+                ON CONFLICT DO NOTHING
+                """,
+                (user_ids, BENCH_CHAT_ID),
+            )
+    return usernames
+
+
+async def cleanup(db, users: int) -> None:
+    async with db.pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM groups WHERE group_chat_id = %s", (BENCH_CHAT_ID,))
+            await cur.execute(
+                "DELETE FROM user_group_chats WHERE group_chat_id = %s", (BENCH_CHAT_ID,)
+            )
+            await cur.execute(
+                "DELETE FROM users WHERE id >= %s AND id < %s",
+                (BENCH_USER_BASE, BENCH_USER_BASE + users),
+            )
+            await cur.execute("DELETE FROM group_chats WHERE id = %s", (BENCH_CHAT_ID,))
+
+
+async def timed(timings: dict, name: str, call) -> object:
+    started = time.perf_counter()
+    result = await call
+    timings.setdefault(name, []).append(time.perf_counter() - started)
+    return result
+
+
+def report_head(report: str, lines: int = 3) -> str:
+    head = report.splitlines()[:lines]
+    return " | ".join(head) + (" | …" if report.count("\n") >= lines else "")
+
+
+async def run(args: argparse.Namespace) -> None:
+    await init_database()
+    db = get_database()
+    await cleanup(db, args.users)
+    usernames = await setup(db, args.users)
+    members = " users:" + ",".join(usernames)
+    user_ids = [BENCH_USER_BASE + index for index in range(args.users)]
+    timings: dict[str, list[float]] = {}
+    samples: dict[str, str] = {}
+    try:
+        for _ in range(args.repeat):
+            report = await timed(
+                timings,
+                "create_group",
+                db.create_group(f"/create group name:{GROUP_NAME}{members}", BENCH_CHAT_ID),
+            )
+            assert report.count("has been added") == args.users, report[:200]
+            samples.setdefault("create_group", report_head(report))
+            report = await timed(
+                timings,
+                "delete_users_from_group",
+                db.delete_users_from_group(
+                    f"/delete users group name:{GROUP_NAME}{members}", BENCH_CHAT_ID
+                ),
+            )
+            assert report.count("has been deleted") == args.users, report[:200]
+            samples.setdefault("delete_users_from_group", report_head(report))
+            report = await timed(
+                timings,
+                "add_users_to_group",
+                db.add_users_to_group(f"/add to group name:{GROUP_NAME}{members}", BENCH_CHAT_ID),
+            )
+            assert report.count("has been added") == args.users, report[:200]
+            samples.setdefault("add_users_to_group", report_head(report))
+            # Saves from the /group UI: first drop every other member, then swap
+            # the remaining half for the other one.
+            previous = user_ids
+            for step, selected in enumerate((user_ids[::2], user_ids[1::2]), 1):
+                ok, summary, _, total = await timed(
+                    timings,
+                    "create_group_with_users",
+                    db.create_group_with_users(BENCH_CHAT_ID, GROUP_NAME, selected),
+                )
+                added = len(set(selected) - set(previous))
+                removed = len(set(previous) - set(selected))
+                assert ok and total == len(selected), (summary, total)
+                assert f"Добавлено участников: {added}." in summary, summary
+                assert removed == 0 or f"Удалено участников: {removed}." in summary, summary
+                samples.setdefault(f"create_group_with_users #{step}", f"{summary} Total: {total}")
+                previous = selected
+            await db.delete_group(f"/delete group name:{GROUP_NAME}", BENCH_CHAT_ID)
+    finally:
+        await cleanup(db, args.users)
+        await close_database()
+
+    print(f"{args.users} users, {args.repeat} runs")
+    for name, values in timings.items():
+        print(
+            f"  {name:<24} median {statistics.median(values) * 1000:8.1f} ms"
+            f"   max {max(values) * 1000:8.1f} ms"
+        )
+    for name, sample in samples.items():
+        print(f"  {name}: {sample}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=250)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from services.media.links import extract_links
+
+# The pattern findLink() used before entity-based extraction.
+LEGACY_PATTERN = r'[(http://)|\w]*?[\w]*\.[-/\w]*\.\w*[(/{1})]?[#-\./\w]*[(/{1,})]?'
+
+CORPORA = {
+    "plain": "привет как дела это просто сообщение в чате без ссылок смотри ok see_you_later".split(),
+    "dotted": "привет как дела file.name.txt v1.2.3 ok... см. выше, т.е. вот так".split(),
+}
+LINKS = (
+    "https://vt.tiktok.com/ZSygmCma1/",
+    "https://www.instagram.com/reel/C1abcDEF/?igsh=MWQ1ZGUxMzBkMA==",
+)
+REPEATS = 200
+
+
+def legacy_find(text: str):
+    answer = re.search(LEGACY_PATTERN, text)
+    return answer.group() if answer is not None else None
+
+
+def build_message(corpus: str, words: int, with_links: bool) -> str:
+    rng = random.Random(words)
+    tokens = [rng.choice(CORPORA[corpus]) for _ in range(words)]
+    if with_links:
+        tokens.insert(words // 2, LINKS[0])
+        tokens.append(LINKS[1])
+    return " ".join(tokens)
+
+
+def per_call_us(func, text: str) -> float:
+    total = timeit.timeit(lambda: func(text), number=REPEATS)
+    return total / REPEATS * 1_000_000
+
+
+def main() -> None:
+    """Per-message cost of the old findLink regex vs. extract_links.
+
+    "entities" is the normal production path, where Telegram already parsed
+    the URLs; "fallback" is the regex scan used when a message has none.
+    The legacy column also shows what findLink returned: it stops at the
+    first dotted token, which is why it is fast (and wrong) on "dotted".
+    """
+    header = f"{'corpus':>7} {'words':>6} {'links':>5} {'legacy µs':>10} {'entities µs':>12} {'fallback µs':>12}  legacy result"
+    print(header)
+    for corpus in CORPORA:
+        for words in (20, 200, 1000, 4000):
+            for with_links in (False, True):
+                text = build_message(corpus, words, with_links)
+                entity_urls = list(LINKS) if with_links else []
+                legacy = per_call_us(legacy_find, text)
+                entities = per_call_us(lambda t: extract_links(t, entity_urls), text)
+                fallback = per_call_us(extract_links, text)
+                assert extract_links(text) == entity_urls
+                print(
+                    f"{corpus:>7} {words:>6} {str(with_links):>5} {legacy:>10.1f} "
+                    f"{entities:>12.1f} {fallback:>12.1f}  {legacy_find(text)!r}"
+                )
+
+
+if __name__ == "__main__":
+    main()
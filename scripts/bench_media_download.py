@@ -0,0 +1,165 @@
+"""Load benchmark for the media download path against the local fake RapidAPI.
+
+Starts one fake server per provider (see scripts/fake_rapidapi.py), points
+TikTok or Instagram providers at them and drives ``MediaDownloader.download``
+(or, with several providers, ``ProviderRegistry.download``) at a target
+concurrency. Reports p50/p95/p99 latency and throughput.
+
+    python scripts/bench_media_download.py --requests 500 --concurrency 50
+    python scripts/bench_media_download.py --providers 2 --error-rates 0.5,0 --latency fixed:0.2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+for path in (ROOT_DIR, ROOT_DIR / "scripts"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from fake_rapidapi import FakeRapidAPI, add_config_arguments, config_from_args
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Settings are read once, so the pipeline limits must be set before any import."""
+    os.environ["MEDIA_RATE_PER_SECOND"] = str(args.rate)
+    os.environ["MEDIA_RATE_BURST"] = str(max(args.rate, 1))
+    os.environ["MEDIA_QUEUE_MAX_WAIT"] = str(args.max_wait)
+    os.environ["MEDIA_HTTP_MAX_CONNECTIONS"] = str(max(args.concurrency, 1))
+    os.environ["MEDIA_HTTP_MAX_KEEPALIVE"] = str(max(args.concurrency, 1))
+    os.environ["MEDIA_PROBE_SIZES"] = "1" if args.probe else "0"
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def build_link(platform: str, index: int) -> str:
+    if platform == "instagram":
+        return f"https://www.instagram.com/p/BENCH{index:06d}/"
+    return f"https://www.tiktok.com/@bench/video/{7000000000000000000 + index}"
+
+
+def build_provider(platform: str, index: int, base_url: str):
+    if platform == "instagram":
+        from services.media.instagram import InstagramDownloader
+
+        return InstagramDownloader(
+            "bench-key",
+            name=f"instagram-fake-{index}",
+            api_url=f"{base_url}/instagram/",
+            api_host="instagram-post-reels-stories-downloader.p.rapidapi.com",
+        )
+    from services.media.tiktok import TikTokDownloader
+
+    return TikTokDownloader(
+        "bench-key",
+        name=f"tiktok-fake-{index}",
+        api_url=f"{base_url}/",
+        api_host="tiktok-video-no-watermark2.p.rapidapi.com",
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    from services.media.base import ProviderError
+    from services.media.http import close_http_client
+    from services.media.metrics import media_metrics
+    from services.media.registry import ProviderRegistry
+    from services.media.scheduler import SchedulerRejected
+
+    error_rates = [float(rate) for rate in args.error_rates.split(",")] if args.error_rates else []
+    servers = []
+    for index in range(args.providers):
+        rate = error_rates[index % len(error_rates)] if error_rates else None
+        servers.append(await FakeRapidAPI(config_from_args(args, error_rate=rate)).start())
+
+    providers = [
+        build_provider(args.platform, index, server.base_url)
+        for index, server in enumerate(servers)
+    ]
+    if len(providers) == 1:
+        download = providers[0].download
+        registry = None
+    else:
+        registry = ProviderRegistry(plugins={})
+        for provider in providers:
+            registry.register(provider)
+        download = registry.download
+
+    links = [build_link(args.platform, index % args.distinct) for index in range(args.requests)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+    outcomes = {"ok": 0, "failed": 0, "rejected": 0}
+
+    async def one(link: str) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await download(link)
+            except SchedulerRejected:
+                outcomes["rejected"] += 1
+                return
+            except ProviderError:
+                result = None
+            latencies.append(time.perf_counter() - started)
+            outcomes["ok" if result else "failed"] += 1
+
+    print(
+        f"{args.requests} {args.platform} requests, concurrency {args.concurrency}, "
+        f"{args.providers} provider(s), latency {args.latency}, {args.distinct} distinct links"
+    )
+    started = time.perf_counter()
+    await asyncio.gather(*(one(link) for link in links))
+    elapsed = time.perf_counter() - started
+
+    print(f"  elapsed     {elapsed:8.2f} s")
+    print(f"  throughput  {args.requests / elapsed:8.1f} req/s")
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        print(f"  {name}         {percentile(latencies, fraction) * 1000:8.1f} ms")
+    print(f"  outcomes    {outcomes}")
+    for index, server in enumerate(servers):
+        print(f"  server {index}    {server.config.counters}")
+    if registry is not None:
+        for name, stats in registry.stats().items():
+            print(f"  {name}: {stats}")
+    for name, stats in media_metrics.stats().items():
+        print(f"  {name}: {stats}")
+
+    await close_http_client()
+    for server in servers:
+        await server.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--platform", choices=("tiktok", "instagram"), default="tiktok")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--distinct", type=int, default=None, help="distinct links (repeats hit the media cache)"
+    )
+    parser.add_argument("--providers", type=int, default=1)
+    parser.add_argument(
+        "--error-rates", default="", help="per-provider error rates, e.g. 0.5,0 (overrides --error-rate)"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=1000.0, help="scheduler tokens per second per provider"
+    )
+    parser.add_argument("--max-wait", type=float, default=60.0)
+    parser.add_argument("--probe", action="store_true", help="enable HEAD size probes")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    args.distinct = args.distinct or args.requests
+    configure_environment(args)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
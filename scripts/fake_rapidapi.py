@@ -0,0 +1,240 @@
+"""Local stand-in for the TikTok and Instagram RapidAPI endpoints.
+
+Answers the same requests TikTokDownloader and InstagramDownloader send, with
+configurable latency, error rate and payload shape, so the download path can
+be load-tested without spending quota. Media URLs in the payloads point back
+at this server (``/media/<name>?size=N``), which answers HEAD and range
+requests for the size probes.
+
+Run standalone::
+
+    python scripts/fake_rapidapi.py --port 8099 --latency lognormal:0.4,0.5 --error-rate 0.05
+
+then point a provider at it, e.g. ``TikTokDownloader(key, api_url="http://127.0.0.1:8099/")``.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    404: "Not Found",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+TIKTOK_SHAPES = ("full", "sd", "no_sizes", "empty")
+MB = 1024 * 1024
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Parse ``fixed:S``, ``uniform:A,B``, ``exp:MEAN`` or ``lognormal:MEDIAN,SIGMA`` (seconds)."""
+    kind, _, raw = spec.partition(":")
+    args = [float(value) for value in raw.split(",") if value]
+    if kind == "fixed":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / args[0])
+    if kind == "lognormal":
+        mu = math.log(args[0])
+        return lambda rng: rng.lognormvariate(mu, args[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+@dataclass
+class FakeConfig:
+    latency: str = "lognormal:0.3,0.5"
+    error_rate: float = 0.0
+    error_statuses: tuple = (500, 502, 503, 429)
+    tiktok_shape: str = "full"
+    hd_size: int = 24 * MB
+    sd_size: int = 8 * MB
+    instagram_items: int = 1
+    seed: Optional[int] = None
+    counters: dict = field(default_factory=lambda: {"requests": 0, "errors": 0, "media": 0})
+
+
+class FakeRapidAPI:
+    """Minimal asyncio HTTP/1.1 server with keep-alive; good enough for httpx."""
+
+    def __init__(self, config: FakeConfig, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config
+        self.host = host
+        self.port = port
+        self._rng = random.Random(config.seed)
+        self._latency = parse_latency(config.latency)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "FakeRapidAPI":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        print(f"Fake RapidAPI listening on {self.base_url}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                if length:
+                    await reader.readexactly(length)
+                status, extra, body = await self._route(method, target, headers)
+                head = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+                head += [f"{name}: {value}" for name, value in extra.items()]
+                if "Content-Length" not in extra:
+                    head.append(f"Content-Length: {len(body)}")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, target: str, headers: dict) -> tuple[int, dict, bytes]:
+        parts = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if parts.path.startswith("/media/"):
+            return self._media(method, parts.path, query, headers)
+
+        counters = self.config.counters
+        counters["requests"] += 1
+        await asyncio.sleep(max(self._latency(self._rng), 0.0))
+        if self._rng.random() < self.config.error_rate:
+            counters["errors"] += 1
+            status = self._rng.choice(self.config.error_statuses)
+            return status, {"Content-Type": "application/json"}, b'{"message": "fake error"}'
+
+        host = headers.get("x-rapidapi-host", "")
+        if "instagram" in host or parts.path.startswith("/instagram"):
+            payload = self._instagram(query.get("url", ""))
+        else:
+            payload = self._tiktok(query.get("url", ""))
+        return 200, {"Content-Type": "application/json"}, json.dumps(payload).encode()
+
+    def _media_url(self, name: str, size: int) -> str:
+        return f"{self.base_url}/media/{name}?size={size}"
+
+    def _tiktok(self, link: str) -> dict:
+        shape = self.config.tiktok_shape
+        video_id = link.rstrip("/").rsplit("/", 1)[-1] or "0"
+        if shape == "empty":
+            return {"code": -1, "msg": "Url parsing is failed!", "data": {}}
+        hd, sd = self.config.hd_size, self.config.sd_size
+        data = {
+            "id": video_id,
+            "play": self._media_url(f"{video_id}-sd.mp4", sd),
+            "wmplay": self._media_url(f"{video_id}-wm.mp4", sd + MB),
+        }
+        if shape != "sd":
+            data["hdplay"] = self._media_url(f"{video_id}-hd.mp4", hd)
+        if shape != "no_sizes":
+            data.update(size=sd, wm_size=sd + MB)
+            if shape != "sd":
+                data["hd_size"] = hd
+        return {"code": 0, "msg": "success", "data": data}
+
+    def _instagram(self, link: str) -> dict:
+        code = link.rstrip("/").rsplit("/", 1)[-1] or "post"
+        result = []
+        for index in range(self.config.instagram_items):
+            is_video = index % 2 == 0
+            name = f"{code}-{index}.{'mp4' if is_video else 'jpg'}"
+            result.append(
+                {
+                    "url": self._media_url(name, self.config.sd_size if is_video else 300 * 1024),
+                    "type": "video/mp4" if is_video else "image/jpeg",
+                }
+            )
+        return {"status": True, "result": result}
+
+    def _media(
+        self, method: str, path: str, query: dict, headers: dict
+    ) -> tuple[int, dict, bytes]:
+        self.config.counters["media"] += 1
+        size = int(query.get("size", "1024"))
+        content_type = "video/mp4" if path.endswith(".mp4") else "image/jpeg"
+        if headers.get("range", "").startswith("bytes=0-0"):
+            return 206, {"Content-Type": content_type, "Content-Range": f"bytes 0-0/{size}"}, b"\0"
+        body = b"" if method == "HEAD" else b"\0" * size
+        return 200, {"Content-Type": content_type, "Content-Length": str(size)}, body
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    add_config_arguments(parser)
+    return parser
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--latency",
+        default=FakeConfig.latency,
+        help="fixed:S | uniform:A,B | exp:MEAN | lognormal:MEDIAN,SIGMA",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-statuses", default="500,502,503,429")
+    parser.add_argument("--tiktok-shape", choices=TIKTOK_SHAPES, default="full")
+    parser.add_argument("--hd-size", type=int, default=FakeConfig.hd_size)
+    parser.add_argument("--sd-size", type=int, default=FakeConfig.sd_size)
+    parser.add_argument("--instagram-items", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace, error_rate: Optional[float] = None) -> FakeConfig:
+    return FakeConfig(
+        latency=args.latency,
+        error_rate=args.error_rate if error_rate is None else error_rate,
+        error_statuses=tuple(int(status) for status in args.error_statuses.split(",")),
+        tiktok_shape=args.tiktok_shape,
+        hd_size=args.hd_size,
+        sd_size=args.sd_size,
+        instagram_items=args.instagram_items,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    arguments = build_parser().parse_args()
+    server = FakeRapidAPI(config_from_args(arguments), arguments.host, arguments.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -6,6 +6,7 @@ ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+from services.media.base import ProviderError
 from services.media.tiktok import downloadTikTok
 
 VIDEO_URL = "https://vt.tiktok.com/ZSygmCma1/"
@@ -13,10 +14,14 @@ VIDEO_URL = "https://vt.tiktok.com/ZSygmCma1/"
 
 async def main() -> None:
     print(f"Downloading TikTok video from {VIDEO_URL} ...")
-    file_name = await downloadTikTok(VIDEO_URL)
-    if not file_name:
+    try:
+        items = await downloadTikTok(VIDEO_URL)
+    except ProviderError as exc:
+        raise SystemExit(f"Failed to download video: {exc}")
+    if not items:
         raise SystemExit("Failed to download video.")
-    print(f"Video saved to: {file_name}")
+    for item in items:
+        print(f"Video URL: {item.url} ({item.variant}, {item.size} bytes)")
 
 
 if __name__ == "__main__":
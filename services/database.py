@@ -7,6 +7,7 @@ from typing import List, Optional, Tuple
 
 from psycopg_pool import AsyncConnectionPool
 
+from services.cache import TTLCache
 from utils.settings import get_settings
 
 logger = logging.getLogger(__name__)
@@ -54,8 +55,43 @@ def parse_group_command(command: str) -> Optional[GroupCommand]:
 class DataBase:
     def __init__(self, pool: AsyncConnectionPool) -> None:
         self.pool = pool
+        settings = get_settings()
+        users = (settings.db_cache_users_size, settings.db_cache_users_ttl)
+        chats = (settings.db_cache_chats_size, settings.db_cache_chats_ttl)
+        groups = (settings.db_cache_groups_size, settings.db_cache_groups_ttl)
+        # Read-through кэши маленьких и редко меняющихся строк. Отсутствующая
+        # строка кэшируется как {}, чтобы повторные промахи тоже не шли в БД.
+        self._users: TTLCache[int, dict] = TTLCache(*users)
+        self._usernames: TTLCache[str, dict] = TTLCache(*users)
+        self._chats: TTLCache[int, dict] = TTLCache(*chats)
+        self._user_chats: TTLCache[int, list[dict]] = TTLCache(*chats)
+        self._groups: TTLCache[int, dict] = TTLCache(*groups)
+        # Индекс упоминаний: чат -> {имя группы: usernames участников}. По нему
+        # обычные @username отсеиваются без запроса к БД.
+        self._group_index: TTLCache[int, dict[str, list[str]]] = TTLCache(*groups)
+
+    def cache_stats(self) -> dict[str, dict]:
+        """Статистика кэшей БД (размер, попадания, hit ratio) для /stats."""
+        return {
+            "users": self._users.stats(),
+            "usernames": self._usernames.stats(),
+            "group_chats": self._chats.stats(),
+            "user_chats": self._user_chats.stats(),
+            "groups": self._groups.stats(),
+            "group_index": self._group_index.stats(),
+        }
+
+    def _forget_user(self, user_id: int, *usernames: Optional[str]) -> None:
+        self._users.pop(user_id)
+        for username in usernames:
+            if username:
+                self._usernames.pop(username)
 
     async def get_user(self, user_id: int):
+        cached = self._users.get(user_id)
+        if cached is not None:
+            return cached or None
+        generation = self._users.generation
         try:
             async with self.pool.connection() as conn:
                 async with conn.cursor() as cur:
@@ -67,12 +103,18 @@ class DataBase:
         except Exception as exc:  # pragma: no cover
             logger.exception("Failed to fetch user %s: %s", user_id, exc)
             return None
-        return {"id": row[0], "first_name": row[1], "username": row[2]} if row else None
+        user = {"id": row[0], "first_name": row[1], "username": row[2]} if row else None
+        self._users.set(user_id, user or {}, generation=generation)
+        return user
 
     async def get_user_by_username(self, username: Optional[str]):
         username = _sanitize_username(username)
         if not username:
             return None
+        cached = self._usernames.get(username)
+        if cached is not None:
+            return cached or None
+        generation = self._usernames.generation
         try:
             async with self.pool.connection() as conn:
                 async with conn.cursor() as cur:
@@ -84,7 +126,49 @@ class DataBase:
         except Exception as exc:  # pragma: no cover
             logger.exception("Failed to fetch user by username %s: %s", username, exc)
             return None
-        return {"id": row[0], "first_name": row[1], "username": row[2]} if row else None
+        user = {"id": row[0], "first_name": row[1], "username": row[2]} if row else None
+        self._usernames.set(username, user or {}, generation=generation)
+        return user
+
+    async def get_users_by_usernames(self, usernames: list[str]) -> dict[str, dict]:
+        """Находит пользователей по списку username одним запросом.
+
+        Закэшированные (в том числе отсутствующие) username в запрос не попадают.
+
+        :param usernames: username (с @ или без), возможны повторы
+        :return: {username: пользователь} только для найденных
+        """
+        wanted = list(dict.fromkeys(filter(None, map(_sanitize_username, usernames))))
+        found: dict[str, dict] = {}
+        missing: list[str] = []
+        for username in wanted:
+            cached = self._usernames.get(username)
+            if cached is None:
+                missing.append(username)
+            elif cached:
+                found[username] = cached
+        if not missing:
+            return found
+
+        generation = self._usernames.generation
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        "SELECT id, first_name, username FROM users WHERE username = ANY(%s)",
+                        (missing,),
+                    )
+                    rows = await cur.fetchall()
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to fetch users by usernames %s: %s", missing, exc)
+            return found
+        loaded = {row[2]: {"id": row[0], "first_name": row[1], "username": row[2]} for row in rows}
+        for username in missing:
+            user = loaded.get(username)
+            self._usernames.set(username, user or {}, generation=generation)
+            if user:
+                found[username] = user
+        return found
 
     async def create_user(
         self, user_id: int, first_name: str, username: Optional[str]
@@ -101,10 +185,13 @@ class DataBase:
                         """,
                         (user_id, first_name, username),
                     )
-                    return cur.rowcount > 0
+                    created = cur.rowcount > 0
         except Exception as exc:  # pragma: no cover
             logger.exception("Failed to create user %s: %s", user_id, exc)
             return False
+        # Сбрасываем и закэшированное «такого пользователя нет».
+        self._forget_user(user_id, username)
+        return created
 
     async def add_group_chat_to_user(self, user_id: int, chat_id: int) -> bool:
         try:
@@ -118,12 +205,14 @@ class DataBase:
                         """,
                         (user_id, chat_id),
                     )
-                    return cur.rowcount > 0
+                    linked = cur.rowcount > 0
         except Exception as exc:  # pragma: no cover
             logger.exception(
                 "Failed to link user %s to chat %s: %s", user_id, chat_id, exc
             )
             return False
+        self._user_chats.pop(user_id)
+        return linked
 
     async def create_group_chat(self, chat_id: int, title: str, chat_type: str) -> bool:
         try:
@@ -137,12 +226,26 @@ class DataBase:
                         """,
                         (chat_id, title, chat_type),
                     )
-                    return cur.rowcount > 0
+                    upserted = cur.rowcount > 0
+                    # Название чата входит в списки чатов его участников.
+                    await cur.execute(
+                        "SELECT user_id FROM user_group_chats WHERE group_chat_id = %s",
+                        (chat_id,),
+                    )
+                    member_ids = [row[0] for row in await cur.fetchall()]
         except Exception as exc:  # pragma: no cover
             logger.exception("Failed to upsert group chat %s: %s", chat_id, exc)
             return False
+        self._chats.pop(chat_id)
+        for user_id in member_ids:
+            self._user_chats.pop(user_id)
+        return upserted
 
     async def get_group_chat(self, chat_id: int):
+        cached = self._chats.get(chat_id)
+        if cached is not None:
+            return cached or None
+        generation = self._chats.generation
         try:
             async with self.pool.connection() as conn:
                 async with conn.cursor() as cur:
@@ -154,7 +257,9 @@ class DataBase:
         except Exception as exc:  # pragma: no cover
             logger.exception("Failed to fetch group chat %s: %s", chat_id, exc)
             return None
-        return {"id": row[0], "title": row[1], "type": row[2]} if row else None
+        chat = {"id": row[0], "title": row[1], "type": row[2]} if row else None
+        self._chats.set(chat_id, chat or {}, generation=generation)
+        return chat
 
     async def migrate_chat(self, old_id: int, new_id: int) -> bool:
         # Обновляет chat_id во всех таблицах при миграции группы в супергруппу.
@@ -173,13 +278,19 @@ class DataBase:
                     )
                     # Обновляем дочерние таблицы.
                     await cur.execute(
-                        "UPDATE user_group_chats SET group_chat_id = %s WHERE group_chat_id = %s",
+                        """
+                        UPDATE user_group_chats SET group_chat_id = %s
+                        WHERE group_chat_id = %s
+                        RETURNING user_id
+                        """,
                         (new_id, old_id),
                     )
+                    member_ids = [row[0] for row in await cur.fetchall()]
                     await cur.execute(
-                        "UPDATE groups SET group_chat_id = %s WHERE group_chat_id = %s",
+                        "UPDATE groups SET group_chat_id = %s WHERE group_chat_id = %s RETURNING id",
                         (new_id, old_id),
                     )
+                    group_ids = [row[0] for row in await cur.fetchall()]
                     await cur.execute(
                         "UPDATE chat_messages SET chat_id = %s WHERE chat_id = %s",
                         (new_id, old_id),
@@ -190,10 +301,18 @@ class DataBase:
                         (old_id,),
                     )
             logger.info("Migrated chat %s -> %s", old_id, new_id)
-            return True
         except Exception as exc:  # pragma: no cover
             logger.exception("Failed to migrate chat %s -> %s: %s", old_id, new_id, exc)
             return False
+        self._chats.pop(old_id)
+        self._chats.pop(new_id)
+        for user_id in member_ids:
+            self._user_chats.pop(user_id)
+        for group_id in group_ids:
+            self._groups.pop(group_id)
+        self._group_index.pop(old_id)
+        self._group_index.pop(new_id)
+        return True
 
     async def get_all_usernames(self, chat_id: int) -> str:
         try:
@@ -223,14 +342,36 @@ class DataBase:
         try:
             async with self.pool.connection() as conn:
                 async with conn.cursor() as cur:
+                    # old видит строку до UPDATE: прежний username нужен для кэша.
                     await cur.execute(
-                        "UPDATE users SET first_name = %s, username = %s WHERE id = %s",
+                        """
+                        UPDATE users AS u
+                        SET first_name = %s, username = %s
+                        FROM users AS old
+                        WHERE u.id = %s AND old.id = u.id
+                        RETURNING old.username
+                        """,
                         (first_name, username, user_id),
                     )
-                    return cur.rowcount > 0
+                    old_usernames = [row[0] for row in await cur.fetchall()]
+                    # Username участника виден в индексе упоминаний его чатов.
+                    await cur.execute(
+                        """
+                        SELECT DISTINCT g.group_chat_id
+                        FROM groups g
+                        JOIN user_groups ug ON ug.group_id = g.id
+                        WHERE ug.user_id = %s
+                        """,
+                        (user_id,),
+                    )
+                    group_chat_ids = [row[0] for row in await cur.fetchall()]
         except Exception as exc:  # pragma: no cover
             logger.exception("Failed to update user %s: %s", user_id, exc)
             return False
+        self._forget_user(user_id, username, *old_usernames)
+        for group_chat_id in group_chat_ids:
+            self._group_index.pop(group_chat_id)
+        return bool(old_usernames)
 
     async def get_group_by_chat_and_name(self, group_chat_id: int, name: str):
         try:
@@ -270,6 +411,64 @@ class DataBase:
             return None
         return name
 
+    async def _change_members(
+        self, cur, group_id: int, usernames: List[str], add: bool
+    ) -> str:
+        """Добавляет или удаляет участников группы одним запросом и строит отчёт.
+
+        :param cur: курсор внутри транзакции вызывающего метода
+        :param group_id: идентификатор группы
+        :param usernames: username в порядке команды (возможны повторы)
+        :param add: True — добавить, False — удалить
+        :return: строки отчёта по каждому username, начиная с перевода строки
+        """
+        if not usernames:
+            return ""
+        if add:
+            change = """
+                INSERT INTO user_groups(user_id, group_id)
+                SELECT DISTINCT id, %(group_id)s FROM found WHERE id IS NOT NULL
+                ON CONFLICT DO NOTHING
+                RETURNING user_id
+            """
+            done, unchanged = "has been added", "is already in group"
+        else:
+            change = """
+                DELETE FROM user_groups
+                WHERE group_id = %(group_id)s
+                  AND user_id IN (SELECT id FROM found WHERE id IS NOT NULL)
+                RETURNING user_id
+            """
+            done, unchanged = "has been deleted", "was not in group"
+        await cur.execute(
+            f"""
+            WITH found AS (
+                SELECT w.username, w.ord, u.id
+                FROM unnest(%(usernames)s::text[]) WITH ORDINALITY AS w(username, ord)
+                LEFT JOIN LATERAL (
+                    SELECT id FROM users WHERE username = w.username LIMIT 1
+                ) u ON true
+            ),
+            changed AS ({change})
+            SELECT f.username, f.id, f.id IN (SELECT user_id FROM changed)
+            FROM found f
+            ORDER BY f.ord
+            """,
+            {"usernames": usernames, "group_id": group_id},
+        )
+        message = ""
+        reported: set[int] = set()
+        for username, user_id, changed in await cur.fetchall():
+            if user_id is None:
+                message += f"\nUser @{username} was not found"
+            elif changed and user_id not in reported:
+                message += f"\nUser @{username} {done}"
+            else:
+                message += f"\nUser @{username} {unchanged}"
+            if user_id is not None:
+                reported.add(user_id)
+        return message
+
     async def create_group(self, command: str, group_chat_id: int) -> str:
         parsed = self._extract_group_command(command, "/create group")
         if not parsed:
@@ -304,32 +503,16 @@ class DataBase:
                             group_id = existing[0]
                             message = f"Group @{parsed.name} already exists"
 
-                        for username in parsed.users:
-                            await cur.execute(
-                                "SELECT id FROM users WHERE username = %s", (username,)
-                            )
-                            user_row = await cur.fetchone()
-                            if not user_row:
-                                message += f"\nUser @{username} was not found"
-                                continue
-                            await cur.execute(
-                                """
-                                INSERT INTO user_groups(user_id, group_id)
-                                VALUES(%s,%s)
-                                ON CONFLICT DO NOTHING
-                                """,
-                                (user_row[0], group_id),
-                            )
-                            if cur.rowcount:
-                                message += f"\nUser @{username} has been added"
-                            else:
-                                message += f"\nUser @{username} is already in group"
+                        message += await self._change_members(
+                            cur, group_id, parsed.users, add=True
+                        )
         except Exception as exc:  # pragma: no cover
             logger.exception(
                 "Failed to create group %s in chat %s: %s", parsed.name, group_chat_id, exc
             )
             return "Не удалось создать группу"
 
+        self._group_index.pop(group_chat_id)
         return message
 
     async def delete_group(self, command: str, group_chat_id: int) -> bool:
@@ -349,12 +532,15 @@ class DataBase:
                         if not group:
                             return False
                         await cur.execute("DELETE FROM groups WHERE id = %s", (group[0],))
-                        return cur.rowcount > 0
+                        deleted = cur.rowcount > 0
         except Exception as exc:  # pragma: no cover
             logger.exception(
                 "Failed to delete group %s in chat %s: %s", group_name, group_chat_id, exc
             )
             return False
+        self._groups.pop(group[0])
+        self._group_index.pop(group_chat_id)
+        return deleted
 
     async def add_users_to_group(self, command: str, group_chat_id: int) -> str:
         parsed = self._extract_group_command(command, "/add to group")
@@ -373,28 +559,9 @@ class DataBase:
                         if not group:
                             return f"Group @{parsed.name} was not found"
 
-                        group_id = group[0]
-                        message = ""
-                        for username in parsed.users:
-                            await cur.execute(
-                                "SELECT id FROM users WHERE username = %s", (username,)
-                            )
-                            user_row = await cur.fetchone()
-                            if not user_row:
-                                message += f"\nUser @{username} was not found"
-                                continue
-                            await cur.execute(
-                                """
-                                INSERT INTO user_groups(user_id, group_id)
-                                VALUES(%s,%s)
-                                ON CONFLICT DO NOTHING
-                                """,
-                                (user_row[0], group_id),
-                            )
-                            if cur.rowcount:
-                                message += f"\nUser @{username} has been added"
-                            else:
-                                message += f"\nUser @{username} is already in group"
+                        message = await self._change_members(
+                            cur, group[0], parsed.users, add=True
+                        )
         except Exception as exc:  # pragma: no cover
             logger.exception(
                 "Failed to add users to group %s in chat %s: %s",
@@ -404,6 +571,7 @@ class DataBase:
             )
             return "Не удалось добавить пользователей"
 
+        self._group_index.pop(group_chat_id)
         return message.strip() or "No users were provided"
 
     async def delete_users_from_group(self, command: str, group_chat_id: int) -> str:
@@ -423,24 +591,9 @@ class DataBase:
                         if not group:
                             return f"Group @{parsed.name} was not found"
 
-                        group_id = group[0]
-                        message = ""
-                        for username in parsed.users:
-                            await cur.execute(
-                                "SELECT id FROM users WHERE username = %s", (username,)
-                            )
-                            user_row = await cur.fetchone()
-                            if not user_row:
-                                message += f"\nUser @{username} was not found"
-                                continue
-                            await cur.execute(
-                                "DELETE FROM user_groups WHERE user_id = %s AND group_id = %s",
-                                (user_row[0], group_id),
-                            )
-                            if cur.rowcount:
-                                message += f"\nUser @{username} has been deleted"
-                            else:
-                                message += f"\nUser @{username} was not in group"
+                        message = await self._change_members(
+                            cur, group[0], parsed.users, add=False
+                        )
         except Exception as exc:  # pragma: no cover
             logger.exception(
                 "Failed to delete users from group %s in chat %s: %s",
@@ -450,6 +603,7 @@ class DataBase:
             )
             return "Не удалось удалить пользователей"
 
+        self._group_index.pop(group_chat_id)
         return message.strip() or "No users were provided"
 
     async def get_groups_for_chat(self, group_chat_id: int):
@@ -469,17 +623,49 @@ class DataBase:
             for row in rows
         ]
 
-    async def get_group_members_by_names(
-        self, group_chat_id: int, names: list[str]
-    ) -> dict[str, list[str]]:
-        sanitized_names = []
-        for name in names:
-            cleaned = _sanitize_username(name)
-            if cleaned and GROUP_NAME_PATTERN.fullmatch(cleaned):
-                sanitized_names.append(cleaned)
-        if not sanitized_names:
-            return {}
+    async def warm_group_index(self) -> int:
+        """Загружает индекс упоминаний групп для всех чатов одним запросом.
 
+        :return: количество проиндексированных чатов
+        """
+        generation = self._group_index.generation
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        SELECT gc.id, g.name,
+                               COALESCE(
+                                   array_agg(u.username ORDER BY u.username)
+                                   FILTER (WHERE u.username IS NOT NULL),
+                                   '{}'
+                               ) AS usernames
+                        FROM group_chats gc
+                        LEFT JOIN groups g ON g.group_chat_id = gc.id
+                        LEFT JOIN user_groups ug ON ug.group_id = g.id
+                        LEFT JOIN users u ON u.id = ug.user_id
+                        GROUP BY gc.id, g.name
+                        """
+                    )
+                    rows = await cur.fetchall()
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to warm group mention index: %s", exc)
+            return 0
+        index: dict[int, dict[str, list[str]]] = {}
+        for chat_id, name, usernames in rows:
+            groups = index.setdefault(chat_id, {})
+            if name is not None:
+                groups[name] = usernames
+        for chat_id, groups in index.items():
+            self._group_index.set(chat_id, groups, generation=generation)
+        return len(index)
+
+    async def _chat_group_index(self, group_chat_id: int) -> Optional[dict[str, list[str]]]:
+        """Возвращает {имя группы: usernames} чата из индекса, загружая его при промахе."""
+        cached = self._group_index.get(group_chat_id)
+        if cached is not None:
+            return cached
+        generation = self._group_index.generation
         try:
             async with self.pool.connection() as conn:
                 async with conn.cursor() as cur:
@@ -494,22 +680,43 @@ class DataBase:
                         FROM groups g
                         LEFT JOIN user_groups ug ON ug.group_id = g.id
                         LEFT JOIN users u ON u.id = ug.user_id
-                        WHERE g.group_chat_id = %s AND g.name = ANY(%s)
+                        WHERE g.group_chat_id = %s
                         GROUP BY g.name
                         """,
-                        (group_chat_id, sanitized_names),
+                        (group_chat_id,),
                     )
                     rows = await cur.fetchall()
         except Exception as exc:  # pragma: no cover
-            logger.exception(
-                "Failed to fetch group members for chat %s and names %s: %s",
-                group_chat_id,
-                sanitized_names,
-                exc,
-            )
+            logger.exception("Failed to load group index for chat %s: %s", group_chat_id, exc)
+            return None
+        groups = {row[0]: row[1] for row in rows}
+        self._group_index.set(group_chat_id, groups, generation=generation)
+        return groups
+
+    async def get_group_members_by_names(
+        self, group_chat_id: int, names: list[str]
+    ) -> dict[str, list[str]]:
+        """Возвращает участников групп чата, упомянутых по имени.
+
+        Имена сверяются с индексом упоминаний чата, поэтому упоминания
+        обычных пользователей не приводят к запросу в БД.
+
+        :param group_chat_id: идентификатор чата
+        :param names: упомянутые имена (с @ или без)
+        :return: {имя группы: usernames участников} только для существующих групп
+        """
+        sanitized_names = []
+        for name in names:
+            cleaned = _sanitize_username(name)
+            if cleaned and GROUP_NAME_PATTERN.fullmatch(cleaned):
+                sanitized_names.append(cleaned)
+        if not sanitized_names:
             return {}
 
-        return {row[0]: row[1] for row in rows}
+        groups = await self._chat_group_index(group_chat_id)
+        if not groups:
+            return {}
+        return {name: list(groups[name]) for name in sanitized_names if name in groups}
 
     async def get_usernames_by_group(self, group_id: int) -> str:
         try:
@@ -535,6 +742,10 @@ class DataBase:
         return ", ".join(usernames) if rows else "Something went wrong"
 
     async def get_group_chats_for_user(self, user_id: int):
+        cached = self._user_chats.get(user_id)
+        if cached is not None:
+            return list(cached)
+        generation = self._user_chats.generation
         try:
             async with self.pool.connection() as conn:
                 async with conn.cursor() as cur:
@@ -554,7 +765,9 @@ class DataBase:
                 "Failed to fetch group chats for user %s: %s", user_id, exc
             )
             return []
-        return [{"id": row[0], "title": row[1], "type": row[2]} for row in rows]
+        chats = [{"id": row[0], "title": row[1], "type": row[2]} for row in rows]
+        self._user_chats.set(user_id, chats, generation=generation)
+        return list(chats)
 
     async def get_chat_users_paginated(
         self, chat_id: int, limit: int, offset: int
@@ -712,6 +925,8 @@ class DataBase:
             )
             return False, "Не удалось переименовать группу"
 
+        self._groups.pop(group_id)
+        self._group_index.pop(group_chat_id)
         return True, f"Группа переименована в @{new_name}"
 
     async def delete_group_by_id(self, group_id: int, group_chat_id: int) -> tuple[bool, str]:
@@ -736,6 +951,8 @@ class DataBase:
                 "Failed to delete group %s in chat %s: %s", group_id, group_chat_id, exc
             )
             return False, "Не удалось удалить группу"
+        self._groups.pop(group_id)
+        self._group_index.pop(group_chat_id)
         return True, "Группа удалена"
 
     async def create_group_with_users(
@@ -753,71 +970,58 @@ class DataBase:
 
         unique_user_ids = list(dict.fromkeys(user_ids or []))
 
-        group_id: Optional[int] = None
-        total_members = 0
-
+        # Один запрос: группа создаётся при необходимости, затем состав
+        # сравнивается с выбранным — удаляются только лишние, добавляются только
+        # новые. Все подзапросы видят снимок до изменений, поэтому новая группа
+        # находится ровно в одной ветке target, а old_total — прежний состав.
         try:
             async with self.pool.connection() as conn:
-                async with conn.transaction():
-                    async with conn.cursor() as cur:
-                        await cur.execute(
-                            """
-                            SELECT id FROM groups WHERE group_chat_id = %s AND name = %s
-                            """,
-                            (group_chat_id, name),
-                        )
-                        existing = await cur.fetchone()
-
-                        if existing:
-                            group_id = existing[0]
-                            created = False
-                        else:
-                            await cur.execute(
-                                """
-                                INSERT INTO groups(name, group_chat_id)
-                                VALUES(%s,%s)
-                                RETURNING id
-                                """,
-                                (name, group_chat_id),
-                            )
-                            row = await cur.fetchone()
-                            if not row:
-                                return False, "Не удалось создать группу", None, 0
-                            group_id = row[0]
-                            created = True
-
-                        await cur.execute(
-                            "DELETE FROM user_groups WHERE group_id = %s", (group_id,)
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        WITH new_group AS (
+                            INSERT INTO groups(name, group_chat_id)
+                            VALUES(%(name)s, %(chat_id)s)
+                            ON CONFLICT (group_chat_id, name) DO NOTHING
+                            RETURNING id
+                        ),
+                        target AS (
+                            SELECT id, true AS created FROM new_group
+                            UNION ALL
+                            SELECT id, false FROM groups
+                            WHERE group_chat_id = %(chat_id)s AND name = %(name)s
+                        ),
+                        allowed AS (
+                            SELECT u.id
+                            FROM users u
+                            JOIN user_group_chats ugc ON ugc.user_id = u.id
+                            WHERE ugc.group_chat_id = %(chat_id)s
+                              AND u.id = ANY(%(user_ids)s::bigint[])
+                        ),
+                        removed AS (
+                            DELETE FROM user_groups ug
+                            USING target t
+                            WHERE ug.group_id = t.id
+                              AND ug.user_id NOT IN (SELECT id FROM allowed)
+                            RETURNING ug.user_id
+                        ),
+                        added AS (
+                            INSERT INTO user_groups(user_id, group_id)
+                            SELECT a.id, t.id FROM allowed a CROSS JOIN target t
+                            ON CONFLICT DO NOTHING
+                            RETURNING user_id
                         )
-
-                        inserted = 0
-                        skipped = 0
-                        if unique_user_ids:
-                            await cur.execute(
-                                """
-                                SELECT u.id
-                                FROM users u
-                                JOIN user_group_chats ugc ON ugc.user_id = u.id
-                                WHERE ugc.group_chat_id = %s AND u.id = ANY(%s)
-                                """,
-                                (group_chat_id, unique_user_ids),
-                            )
-                            allowed_ids = [row[0] for row in await cur.fetchall()]
-
-                            for user_id in allowed_ids:
-                                await cur.execute(
-                                    """
-                                    INSERT INTO user_groups(user_id, group_id)
-                                    VALUES(%s,%s)
-                                    ON CONFLICT DO NOTHING
-                                    """,
-                                    (user_id, group_id),
-                                )
-                                if cur.rowcount:
-                                    inserted += 1
-
-                            skipped = len(unique_user_ids) - len(allowed_ids)
-
+                        SELECT t.id,
+                               t.created,
+                               (SELECT COUNT(*) FROM allowed),
+                               (SELECT COUNT(*) FROM added),
+                               (SELECT COUNT(*) FROM removed),
+                               (SELECT COUNT(*) FROM user_groups WHERE group_id = t.id)
+                        FROM target t
+                        """,
+                        {"name": name, "chat_id": group_chat_id, "user_ids": unique_user_ids},
+                    )
+                    row = await cur.fetchone()
         except Exception as exc:  # pragma: no cover
             logger.exception(
                 "Failed to create/update group %s in chat %s with users %s: %s",
@@ -826,22 +1030,20 @@ class DataBase:
                 unique_user_ids,
                 exc,
             )
-            return False, "Не удалось сохранить группу", group_id, total_members
+            return False, "Не удалось сохранить группу", None, 0
+        if not row:
+            return False, "Не удалось создать группу", None, 0
 
-        try:
-            async with self.pool.connection() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute(
-                        "SELECT COUNT(*) FROM user_groups WHERE group_id = %s", (group_id,)
-                    )
-                    row = await cur.fetchone()
-                    total_members = row[0] if row else 0
-        except Exception as exc:  # pragma: no cover
-            logger.exception("Failed to count members for group %s: %s", group_id, exc)
+        group_id, created, allowed, added, removed, old_total = row
+        self._group_index.pop(group_chat_id)
+        total_members = old_total - removed + added
+        skipped = len(unique_user_ids) - allowed
 
         action = "создана" if created else "обновлена"
         parts = [f"Группа @{name} {action}."]
-        parts.append(f"Добавлено участников: {inserted}.")
+        parts.append(f"Добавлено участников: {added}.")
+        if removed > 0:
+            parts.append(f"Удалено участников: {removed}.")
         if skipped > 0:
             parts.append(f"Пропущено: {skipped} (нет в чате).")
         return True, " ".join(parts), group_id, total_members
@@ -852,6 +1054,10 @@ class DataBase:
         :param group_id: идентификатор группы
         :return: dict или None
         """
+        cached = self._groups.get(group_id)
+        if cached is not None:
+            return cached or None
+        generation = self._groups.generation
         try:
             async with self.pool.connection() as conn:
                 async with conn.cursor() as cur:
@@ -863,7 +1069,9 @@ class DataBase:
         except Exception as exc:  # pragma: no cover
             logger.exception("Failed to fetch group by id %s: %s", group_id, exc)
             return None
-        return {"id": row[0], "name": row[1], "group_chat_id": row[2]} if row else None
+        group = {"id": row[0], "name": row[1], "group_chat_id": row[2]} if row else None
+        self._groups.set(group_id, group or {}, generation=generation)
+        return group
 
 
     async def add_chat_message(
@@ -955,6 +1163,287 @@ class DataBase:
             for row in rows
         ]
 
+    async def get_media_file_id(self, link_key: str) -> Optional[dict]:
+        """Возвращает сохранённый file_id для ссылки и обновляет last_used_at.
+
+        :param link_key: канонический ключ медиа-ссылки
+        :return: dict с file_id и media_type или None
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        UPDATE media_file_ids
+                        SET last_used_at = NOW()
+                        WHERE link_key = %s
+                        RETURNING file_id, media_type
+                        """,
+                        (link_key,),
+                    )
+                    row = await cur.fetchone()
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to fetch media file_id for %s: %s", link_key, exc)
+            return None
+        return {"file_id": row[0], "media_type": row[1]} if row else None
+
+    async def save_media_file_id(
+        self, link_key: str, file_id: str, media_type: str
+    ) -> bool:
+        """Сохраняет (или заменяет) file_id для ссылки.
+
+        :param link_key: канонический ключ медиа-ссылки
+        :param file_id: file_id, выданный Telegram после отправки
+        :param media_type: photo или video
+        :return: True при успехе
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        INSERT INTO media_file_ids(link_key, file_id, media_type)
+                        VALUES(%s,%s,%s)
+                        ON CONFLICT (link_key) DO UPDATE
+                        SET file_id = EXCLUDED.file_id,
+                            media_type = EXCLUDED.media_type,
+                            last_used_at = NOW()
+                        """,
+                        (link_key, file_id, media_type),
+                    )
+                    return True
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to save media file_id for %s: %s", link_key, exc)
+            return False
+
+    async def delete_media_file_id(self, link_key: str) -> bool:
+        """Удаляет file_id, который Telegram отказался принимать.
+
+        :param link_key: канонический ключ медиа-ссылки
+        :return: True, если запись была удалена
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        "DELETE FROM media_file_ids WHERE link_key = %s", (link_key,)
+                    )
+                    return cur.rowcount > 0
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to delete media file_id for %s: %s", link_key, exc)
+            return False
+
+    async def prune_media_file_ids(self, max_age_days: int) -> int:
+        """Удаляет file_id, которые не использовались дольше max_age_days.
+
+        :param max_age_days: срок хранения в днях
+        :return: количество удалённых записей
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        DELETE FROM media_file_ids
+                        WHERE last_used_at < NOW() - make_interval(days => %s)
+                        """,
+                        (max_age_days,),
+                    )
+                    return cur.rowcount
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to prune media file_ids: %s", exc)
+            return 0
+
+    async def consume_quota(self, key: str, limit: int) -> Optional[int]:
+        """Атомарно списывает одну единицу квоты.
+
+        :param key: ключ квоты
+        :param limit: начальное значение, если квоты ещё нет
+        :return: остаток после списания или None, если квота исчерпана
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        INSERT INTO quotas(key, remaining) VALUES(%s,%s)
+                        ON CONFLICT (key) DO NOTHING
+                        """,
+                        (key, limit),
+                    )
+                    await cur.execute(
+                        """
+                        UPDATE quotas
+                        SET remaining = remaining - 1, updated_at = NOW()
+                        WHERE key = %s AND remaining > 0
+                        RETURNING remaining
+                        """,
+                        (key,),
+                    )
+                    row = await cur.fetchone()
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to consume quota %s: %s", key, exc)
+            return None
+        return row[0] if row else None
+
+    async def get_quota(self, key: str, limit: int) -> int:
+        """Возвращает остаток квоты.
+
+        :param key: ключ квоты
+        :param limit: значение по умолчанию, если квоты ещё нет
+        :return: остаток
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        "SELECT remaining FROM quotas WHERE key = %s", (key,)
+                    )
+                    row = await cur.fetchone()
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to fetch quota %s: %s", key, exc)
+            return 0
+        return row[0] if row else limit
+
+    async def set_quota(self, key: str, remaining: int) -> bool:
+        """Устанавливает остаток квоты (например, при сбросе).
+
+        :param key: ключ квоты
+        :param remaining: новый остаток
+        :return: True при успехе
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        INSERT INTO quotas(key, remaining) VALUES(%s,%s)
+                        ON CONFLICT (key) DO UPDATE
+                        SET remaining = EXCLUDED.remaining, updated_at = NOW()
+                        """,
+                        (key, remaining),
+                    )
+                    return True
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to set quota %s: %s", key, exc)
+            return False
+
+    async def add_media_retry(
+        self, chat_id: int, message_id: int, link: str, delay_seconds: float, error: str
+    ) -> bool:
+        """Ставит ссылку в очередь повторных загрузок (или сдвигает уже стоящую).
+
+        :param chat_id: чат исходного сообщения
+        :param message_id: id исходного сообщения, на которое ответим
+        :param link: ссылка на медиа
+        :param delay_seconds: через сколько секунд повторить
+        :param error: текст последней ошибки
+        :return: True при успехе
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        INSERT INTO media_retries(chat_id, message_id, link, last_error, next_attempt_at)
+                        VALUES(%s, %s, %s, %s, NOW() + make_interval(secs => %s))
+                        ON CONFLICT (chat_id, message_id, link) DO UPDATE
+                        SET last_error = EXCLUDED.last_error,
+                            next_attempt_at = EXCLUDED.next_attempt_at
+                        """,
+                        (chat_id, message_id, link, error, delay_seconds),
+                    )
+                    return True
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to add media retry for %s: %s", link, exc)
+            return False
+
+    async def claim_media_retries(self, limit: int, lease_seconds: float) -> list[dict]:
+        """Забирает до limit просроченных повторов, откладывая их на lease_seconds.
+
+        Отложенные записи не достанутся другому запуску (или другой реплике),
+        пока текущая попытка не завершится или не истечёт аренда.
+
+        :param limit: максимум записей
+        :param lease_seconds: на сколько отодвинуть next_attempt_at забранных записей
+        :return: список dict с id, chat_id, message_id, link, attempts
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        UPDATE media_retries
+                        SET next_attempt_at = NOW() + make_interval(secs => %s)
+                        WHERE id IN (
+                            SELECT id FROM media_retries
+                            WHERE next_attempt_at <= NOW()
+                            ORDER BY next_attempt_at
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING id, chat_id, message_id, link, attempts
+                        """,
+                        (lease_seconds, limit),
+                    )
+                    rows = await cur.fetchall()
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to claim media retries: %s", exc)
+            return []
+        return [
+            {
+                "id": row[0],
+                "chat_id": row[1],
+                "message_id": row[2],
+                "link": row[3],
+                "attempts": row[4],
+            }
+            for row in rows
+        ]
+
+    async def reschedule_media_retry(
+        self, retry_id: int, delay_seconds: float, error: str
+    ) -> bool:
+        """Увеличивает счётчик попыток и назначает следующую.
+
+        :param retry_id: id записи
+        :param delay_seconds: через сколько секунд повторить
+        :param error: текст последней ошибки
+        :return: True при успехе
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        """
+                        UPDATE media_retries
+                        SET attempts = attempts + 1,
+                            last_error = %s,
+                            next_attempt_at = NOW() + make_interval(secs => %s)
+                        WHERE id = %s
+                        """,
+                        (error, delay_seconds, retry_id),
+                    )
+                    return True
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to reschedule media retry %s: %s", retry_id, exc)
+            return False
+
+    async def delete_media_retry(self, retry_id: int) -> bool:
+        """Удаляет запись повтора (после успеха или окончательной неудачи).
+
+        :param retry_id: id записи
+        :return: True при успехе
+        """
+        try:
+            async with self.pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("DELETE FROM media_retries WHERE id = %s", (retry_id,))
+                    return True
+        except Exception as exc:  # pragma: no cover
+            logger.exception("Failed to delete media retry %s: %s", retry_id, exc)
+            return False
+
 
 _pool: AsyncConnectionPool | None = None
 _db_instance: DataBase | None = None
@@ -982,6 +1471,8 @@ async def init_database() -> None:
     _pool = AsyncConnectionPool(conninfo, min_size=1, max_size=10, open=False)
     await _pool.open()
     _db_instance = DataBase(_pool)
+    indexed = await _db_instance.warm_group_index()
+    logger.info("Group mention index warmed for %d chats", indexed)
 
 
 async def close_database() -> None:
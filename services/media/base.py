@@ -2,30 +2,170 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Optional
+from typing import Awaitable, Callable, Dict, Generic, Optional, TypeVar
+import asyncio
+import hashlib
 import logging
 
 import httpx
 
+from services.media.cache import media_cache
+from services.media.http import get_http_client
+from services.media.links import MediaKey, canonicalize
+from services.media.metrics import RequestTrace, media_metrics
+from services.media.scheduler import media_scheduler
+from services.usage import RateLimit, UsageTracker
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Request budget of the primary TikTok provider until a response reports the plan limit.
+DEFAULT_QUOTA = 150
+
+
+def quota_key(platform: str, host: Optional[str] = None) -> str:
+    """Quota store key of a provider's request budget.
+
+    Mirrors are keyed by a short hash of their host: RapidAPI host names are
+    long, and ``quotas.key`` (plus the ``:reset_at`` suffix) must fit 64 chars.
+    """
+    if host is None:
+        return f"{platform}_requests_remaining"
+    digest = hashlib.sha1(host.encode()).hexdigest()[:10]
+    return f"{platform}:{digest}_requests_remaining"
+
+
+class InFlightRequests(Generic[T]):
+    """Coalesces concurrent calls for the same key into one shared task.
+
+    The first caller starts the work; later callers await the same task.
+    Waiters are shielded, so a cancelled waiter never cancels the work for
+    the others. The task is forgotten once it finishes, so neither results
+    nor errors outlive it here.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away.
+            task.exception()
+
 
 @dataclass
 class MediaInfo:
     url: str
     extension: str = ".mp4"
+    size: Optional[int] = None
+    variant: Optional[str] = None
+
+
+class ProviderError(Exception):
+    """A provider could not turn a link into media.
+
+    ``retryable`` failures (network errors, 5xx, 429) say something about the
+    provider's health; the rest (bad link, private post) are about the link.
+    """
+
+    def __init__(
+        self, provider: str, message: str, status: Optional[int] = None, retryable: bool = True
+    ) -> None:
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+        self.retryable = retryable
+
+
+_in_flight: "InFlightRequests[Optional[list[MediaInfo]]]" = InFlightRequests()
+
+
+async def download_cached(
+    link: str,
+    fetch: Callable[[str], Awaitable[list[MediaInfo]]],
+    media_key: Optional[MediaKey] = None,
+) -> Optional[list[MediaInfo]]:
+    """Resolve a link through the media cache and single-flight, calling ``fetch`` on a miss.
+
+    ``fetch`` gets the canonical URL and raises ProviderError on failure.
+    Failures about the link itself are logged here and turned into None;
+    retryable ones propagate (as does SchedulerRejected) so the caller can
+    try again later. A caller that already canonicalized the link passes its
+    ``media_key`` so short links are not resolved twice.
+    """
+    if media_key is None:
+        media_key = await canonicalize(link)
+    if media_key:
+        cache_key, link = media_key.key, media_key.url
+    else:
+        cache_key = link.strip()
+    cached = media_cache.get(cache_key)
+    media_metrics.record_cache(media_key.provider if media_key else "unknown", bool(cached))
+    if cached:
+        logger.info("Media cache hit for %s", cache_key)
+        return cached
+
+    async def fetch_and_cache() -> Optional[list[MediaInfo]]:
+        try:
+            items = await fetch(link)
+        except ProviderError as exc:
+            logger.error("Download failed for %s: %s", cache_key, exc)
+            if exc.retryable:
+                raise
+            return None
+        media_cache.set(cache_key, items)
+        return items
+
+    return await _in_flight.run(cache_key, fetch_and_cache)
 
 
 class MediaDownloader(ABC):
-    """Base helper for RapidAPI-powered media downloaders."""
+    """Base helper for RapidAPI-powered media downloaders.
+
+    ``platform`` is what the provider downloads (tiktok, instagram); ``name``
+    identifies this particular provider for scheduling, quotas and health.
+    ``api_url``/``api_host`` can be overridden per instance to point the same
+    implementation at a mirror or at a local fake server.
+    """
 
+    name: str
+    platform: str
     api_url: str
     api_host: str
 
-    def __init__(self, api_key: str) -> None:
+    def __init__(
+        self,
+        api_key: str,
+        usage_tracker: Optional[UsageTracker] = None,
+        *,
+        name: Optional[str] = None,
+        api_url: Optional[str] = None,
+        api_host: Optional[str] = None,
+    ) -> None:
         if not api_key:
             raise ValueError(f"{self.__class__.__name__} API key is missing")
         self.api_key = api_key
+        self.usage_tracker = usage_tracker
+        if name:
+            self.name = name
+        if api_url:
+            self.api_url = api_url
+        if api_host:
+            self.api_host = api_host
 
     def build_headers(self) -> dict:
         return {
@@ -37,38 +177,73 @@ class MediaDownloader(ABC):
         return {"url": link}
 
     @abstractmethod
-    def extract_media(self, payload: dict) -> Optional[MediaInfo]:
-        """Convert provider response into a downloadable media descriptor."""
-
-    async def download(self, link: str) -> Optional[MediaInfo]:
+    def extract_media(self, payload: dict) -> list[MediaInfo]:
+        """Convert provider response into downloadable media items (empty if none)."""
+
+    async def resolve_media(self, payload: dict) -> list[MediaInfo]:
+        """Async hook around extract_media for providers that need network checks."""
+        return self.extract_media(payload)
+
+    async def download(
+        self,
+        link: str,
+        chat_id: Optional[int] = None,
+        media_key: Optional[MediaKey] = None,
+    ) -> Optional[list[MediaInfo]]:
+        """Resolve a link with this provider only, going to it only on a cache miss.
+
+        Raises SchedulerRejected when the provider queue is too long and
+        ProviderError on a retryable failure.
+        """
+        return await download_cached(link, lambda url: self.fetch(url, chat_id), media_key)
+
+    async def fetch(self, link: str, chat_id: Optional[int] = None) -> list[MediaInfo]:
+        """Ask the provider for a canonical link; raises ProviderError on failure."""
+        await media_scheduler.acquire(self.name, chat_id)
+        if self.usage_tracker and not await self.usage_tracker.consume():
+            media_metrics.record_error(self.name, "quota")
+            # Our own budget, not a provider fault: no health penalty, no retries.
+            raise ProviderError(self.name, "request limit reached", retryable=False)
+
+        trace = RequestTrace()
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.get(
-                    self.api_url,
-                    headers=self.build_headers(),
-                    params=self.build_query(link),
-                )
+            response = await get_http_client().get(
+                self.api_url,
+                headers=self.build_headers(),
+                params=self.build_query(link),
+                extensions={"trace": trace},
+            )
         except httpx.HTTPError as exc:
-            logger.error("%s request failed: %s", self.__class__.__name__, exc)
-            return None
+            media_metrics.record_error(self.name, type(exc).__name__)
+            raise ProviderError(self.name, f"request failed: {exc!r}") from exc
+        media_metrics.record_response(self.name, trace, response.status_code, len(response.content))
+        if self.usage_tracker:
+            rate_limit = RateLimit.from_headers(response.headers)
+            if rate_limit:
+                await self.usage_tracker.sync(rate_limit)
 
         if response.status_code != 200:
-            logger.error(
-                "%s request failed: %s %s",
-                self.__class__.__name__,
-                response.status_code,
-                response.text,
+            raise ProviderError(
+                self.name,
+                f"request failed: {response.status_code} {response.text[:200]}",
+                status=response.status_code,
+                retryable=response.status_code == 429 or response.status_code >= 500,
             )
-            return None
 
-        payload = response.json()
-        media_info = self.extract_media(payload)
-        if not media_info:
-            logger.error(
-                "%s did not return downloadable media: %s",
-                self.__class__.__name__,
-                payload,
+        try:
+            payload = response.json()
+        except ValueError as exc:
+            media_metrics.record_error(self.name, "bad_json")
+            raise ProviderError(self.name, "response is not JSON", status=200) from exc
+        items = await self.resolve_media(payload)
+        if not items:
+            media_metrics.record_error(self.name, "no_media")
+            raise ProviderError(
+                self.name,
+                f"no downloadable media in response: {str(payload)[:200]}",
+                status=200,
+                retryable=False,
             )
-            return None
-
-        return media_info
+        for item in items:
+            media_metrics.record_variant(self.name, item.variant or item.extension.lstrip("."))
+        return items
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from services.cache import TTLCache
+from utils.settings import get_settings
+
+if TYPE_CHECKING:
+    from services.media.base import MediaInfo
+
+
+_settings = get_settings()
+# Keep the TTL below the lifetime of the provider's signed CDN URLs.
+media_cache: "TTLCache[str, list[MediaInfo]]" = TTLCache(
+    max_entries=_settings.media_cache_size,
+    ttl=_settings.media_cache_ttl,
+)
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from services.cache import TTLCache
+from services.database import get_database
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedFile:
+    file_id: str
+    media_type: str
+
+
+class FileIdCache:
+    """Telegram file_id store: in-memory front cache over the media_file_ids table."""
+
+    def __init__(self, max_entries: int, ttl: float = 3600) -> None:
+        self._front: TTLCache[str, CachedFile] = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    async def get(self, link_key: str) -> Optional[CachedFile]:
+        cached = self._front.get(link_key)
+        if cached:
+            return cached
+        row = await get_database().get_media_file_id(link_key)
+        if not row:
+            return None
+        cached = CachedFile(file_id=row["file_id"], media_type=row["media_type"])
+        self._front.set(link_key, cached)
+        return cached
+
+    async def save(self, link_key: str, file_id: str, media_type: str) -> None:
+        self._front.set(link_key, CachedFile(file_id=file_id, media_type=media_type))
+        await get_database().save_media_file_id(link_key, file_id, media_type)
+
+    async def invalidate(self, link_key: str) -> None:
+        self._front.pop(link_key)
+        await get_database().delete_media_file_id(link_key)
+
+    async def prune(self, max_age_days: int) -> int:
+        removed = await get_database().prune_media_file_ids(max_age_days)
+        if removed:
+            # Stale rows may still sit in the front cache; drop it wholesale.
+            self._front.clear()
+            logger.info("Pruned %s stale media file_ids", removed)
+        return removed
+
+    def stats(self) -> dict:
+        return self._front.stats()
+
+
+file_id_cache = FileIdCache(max_entries=get_settings().media_cache_size)
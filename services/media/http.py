@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import importlib.util
+import logging
+
+import httpx
+
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    settings = get_settings()
+    http2 = settings.media_http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("MEDIA_HTTP2 is enabled but 'h2' is not installed; using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.media_http_max_connections,
+            max_keepalive_connections=settings.media_http_max_keepalive,
+            keepalive_expiry=settings.media_http_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            settings.media_read_timeout,
+            connect=settings.media_connect_timeout,
+        ),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
+
+
+async def init_http_client() -> None:
+    get_http_client()
+
+
+async def close_http_client() -> None:
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is None:
+        return
+    try:
+        await client.aclose()
+    except Exception as exc:  # pragma: no cover
+        logger.exception("Failed to close media HTTP client: %s", exc)
@@ -1,31 +1,108 @@
+import logging
 from typing import Optional
 
-from services.media.base import MediaDownloader, MediaInfo
-from utils.settings import get_settings
+from services.media.base import MediaDownloader, MediaInfo, quota_key
+from services.media.links import INSTAGRAM
+from services.media.probe import ProbeResult, probe_all
+from services.media.registry import media_registry, mirror_hosts
+from services.usage import UsageTracker
+from utils.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _extension(content_type: str) -> Optional[str]:
+    content_type = content_type.lower()
+    if content_type.startswith("image/"):
+        return ".jpeg"
+    if content_type.startswith("video/"):
+        return ".mp4"
+    return None
 
 
 class InstagramDownloader(MediaDownloader):
+    name = "instagram"
+    platform = INSTAGRAM
     api_url = "https://instagram-post-reels-stories-downloader.p.rapidapi.com/instagram/"
     api_host = "instagram-post-reels-stories-downloader.p.rapidapi.com"
 
-    def extract_media(self, payload: dict):
+    def __init__(
+        self,
+        api_key: str,
+        usage_tracker: Optional[UsageTracker] = None,
+        probe: Optional[bool] = None,
+        **overrides,
+    ) -> None:
+        super().__init__(api_key, usage_tracker=usage_tracker, **overrides)
+        self.probe = get_settings().media_probe_sizes if probe is None else probe
+
+    def _items(self, payload: dict) -> list[tuple[str, Optional[str]]]:
+        """(url, extension or None when the API did not say) for every carousel item."""
         if not payload.get('status'):
-            return None
-        results = payload.get('result') or []
-        if not results:
-            return None
-        first_result = results[0]
-        media_type = first_result.get('type', '')
-        extension = '.jpeg' if media_type == 'image/jpeg' else '.mp4'
-        media_url = first_result.get('url')
-        if not media_url:
-            return None
-        return MediaInfo(url=media_url, extension=extension)
+            return []
+        items = []
+        for result in payload.get('result') or []:
+            media_url = result.get('url')
+            if media_url:
+                items.append((media_url, _extension(result.get('type') or '')))
+        return items
+
+    def extract_media(self, payload: dict) -> list[MediaInfo]:
+        return [
+            MediaInfo(url=media_url, extension=extension or '.mp4')
+            for media_url, extension in self._items(payload)
+        ]
+
+    async def resolve_media(self, payload: dict) -> list[MediaInfo]:
+        items = self._items(payload)
+        # Items without a type are probed for it; sizes only when probing is on.
+        to_probe = [url for url, extension in items if self.probe or extension is None]
+        probes = await probe_all(to_probe) if to_probe else {}
+
+        media = []
+        for media_url, extension in items:
+            result = probes.get(media_url) or ProbeResult()
+            extension = extension or _extension(result.content_type or '') or '.mp4'
+            media.append(MediaInfo(url=media_url, extension=extension, size=result.size))
+
+        photos = sum(1 for item in media if item.extension == '.jpeg')
+        total = sum(item.size or 0 for item in media)
+        logger.info(
+            "Instagram post: %d items (%d photos, %d videos), %d probed, %d bytes known",
+            len(media), photos, len(media) - photos, len(probes), total,
+        )
+        for index, item in enumerate(media, start=1):
+            logger.debug(
+                "Instagram item %d/%d: %s, %s bytes", index, len(media), item.extension, item.size
+            )
+        return media
 
 
-settings = get_settings()
-instagram_downloader = InstagramDownloader(settings.instagram_api_key)
+def build_providers(settings: Settings) -> list[MediaDownloader]:
+    """Instagram providers for the registry; none when INSTAGRAM_KEY is not set."""
+    if not settings.instagram_api_key:
+        logger.warning("INSTAGRAM_KEY is not set; Instagram downloads are disabled")
+        return []
+    providers: list[MediaDownloader] = [
+        InstagramDownloader(
+            settings.instagram_api_key,
+            usage_tracker=UsageTracker(key=quota_key(INSTAGRAM)),
+        )
+    ]
+    for host in mirror_hosts(settings.instagram_mirror_hosts):
+        providers.append(
+            InstagramDownloader(
+                settings.instagram_api_key,
+                usage_tracker=UsageTracker(key=quota_key(INSTAGRAM, host)),
+                name=f"instagram:{host}",
+                api_url=f"https://{host}/instagram/",
+                api_host=host,
+            )
+        )
+    return providers
 
 
-async def downloadInstagram(link) -> Optional[MediaInfo]:
-    return await instagram_downloader.download(link)
+async def downloadInstagram(
+    link, chat_id: Optional[int] = None
+) -> Optional[list[MediaInfo]]:
+    return await media_registry.download(link, chat_id)
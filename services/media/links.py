@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+from services.cache import TTLCache
+from services.media.http import get_http_client
+
+logger = logging.getLogger(__name__)
+
+TIKTOK = "tiktok"
+INSTAGRAM = "instagram"
+
+_TIKTOK_SHORT_HOSTS = {"vm.tiktok.com", "vt.tiktok.com"}
+_TIKTOK_VIDEO_PATH = re.compile(r"^/(?:@[\w.-]*/(?:video|photo)|v|embed(?:/v2)?)/(\d+)")
+_TIKTOK_SHORT_PATH = re.compile(r"^/t/[\w-]+")
+# The optional segment is the author's username; share/ links are short links.
+_INSTAGRAM_POST_PATH = re.compile(r"^/(?:(?!share/)[\w.]+/)?(p|reels?|tv)/([\w-]+)")
+_INSTAGRAM_STORY_PATH = re.compile(r"^/stories/([\w.]+)/(\d+)")
+_INSTAGRAM_SHARE_PATH = re.compile(r"^/share/(?:(?:p|reels?)/)?[\w-]+")
+
+# Bare or schemed links on a supported host. The lookbehind anchors matches to
+# token starts and the host is a literal, so a match attempt never backtracks
+# past the current token. The lookahead ends the host there, so tiktok.company
+# or instagram.com.evil.net do not match; a sentence-final dot still may.
+_LINK_PATTERN = re.compile(
+    r"(?<![\w@.-])(?:https?://)?(?:[a-z0-9-]+\.)*(?:tiktok\.com|instagram\.com|instagr\.am)"
+    r"(?![\w-]|\.[\w-])(?::\d+)?(?:/[^\s<>\"'()]*)?",
+    re.IGNORECASE,
+)
+_LINK_HINTS = ("tiktok", "instagr")
+_MAX_TOKEN_LENGTH = 2048
+
+_MAX_REDIRECTS = 5
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# Short links are stable, so their redirect target can be cached for a day.
+_resolved_links: TTLCache[str, str] = TTLCache(max_entries=2048, ttl=24 * 60 * 60)
+
+
+@dataclass(frozen=True)
+class MediaKey:
+    """Stable identity of a supported post: provider plus provider-side media id."""
+
+    provider: str
+    media_id: str
+    url: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.media_id}"
+
+
+def _split(link: str):
+    cleaned = link.strip()
+    if "://" not in cleaned:
+        cleaned = f"https://{cleaned}"
+    parts = urlsplit(cleaned)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    elif host.startswith("m."):
+        host = host[2:]
+    return host, parts.path
+
+
+def _is_tiktok_host(host: str) -> bool:
+    return host == "tiktok.com" or host.endswith(".tiktok.com")
+
+
+def _is_instagram_host(host: str) -> bool:
+    return host in {"instagram.com", "instagr.am"} or host.endswith(".instagram.com")
+
+
+def detect_provider(link: str) -> Optional[str]:
+    """Return the provider a link belongs to, without any network access."""
+    host, _ = _split(link)
+    if _is_tiktok_host(host):
+        return TIKTOK
+    if _is_instagram_host(host):
+        return INSTAGRAM
+    return None
+
+
+def _token_bounds(text: str, pos: int) -> tuple[int, int]:
+    start, end = pos, pos
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    while end < len(text) and not text[end].isspace():
+        end += 1
+    return start, end
+
+
+def _scan_links(text: str) -> list[str]:
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # Rare case-mapping changed offsets; fall back to a full scan.
+        return _LINK_PATTERN.findall(text)
+    tokens: set[tuple[int, int]] = set()
+    for hint in _LINK_HINTS:
+        pos = lowered.find(hint)
+        while pos != -1:
+            tokens.add(_token_bounds(text, pos))
+            pos = lowered.find(hint, pos + len(hint))
+    links = []
+    for start, end in sorted(tokens):
+        links.extend(_LINK_PATTERN.findall(text, start, min(end, start + _MAX_TOKEN_LENGTH)))
+    return links
+
+
+def extract_links(text: str, entity_urls: Iterable[str] = ()) -> list[str]:
+    """Return every supported link in a message, in order and without duplicates.
+
+    ``entity_urls`` are the url/text_link entities Telegram already parsed;
+    the regex is only a fallback for messages that carry no URL entities,
+    and it only runs from tokens that contain a provider name.
+    """
+    candidates = list(entity_urls) or _scan_links(text)
+    links: list[str] = []
+    for candidate in candidates:
+        if candidate not in links and detect_provider(candidate):
+            links.append(candidate)
+    return links
+
+
+def is_short_link(link: str) -> bool:
+    host, path = _split(link)
+    if host in _TIKTOK_SHORT_HOSTS:
+        return True
+    if _is_tiktok_host(host) and _TIKTOK_SHORT_PATH.match(path):
+        return True
+    return _is_instagram_host(host) and bool(_INSTAGRAM_SHARE_PATH.match(path))
+
+
+def parse_media_link(link: str) -> Optional[MediaKey]:
+    """Map a full (already resolved) post URL to its MediaKey."""
+    host, path = _split(link)
+    if _is_tiktok_host(host):
+        match = _TIKTOK_VIDEO_PATH.match(path)
+        if not match:
+            return None
+        return MediaKey(TIKTOK, match.group(1), f"https://www.tiktok.com{match.group(0)}")
+    if _is_instagram_host(host):
+        match = _INSTAGRAM_POST_PATH.match(path)
+        if match:
+            kind = "reel" if match.group(1).startswith("reel") else match.group(1)
+            code = match.group(2)
+            return MediaKey(INSTAGRAM, code, f"https://www.instagram.com/{kind}/{code}/")
+        match = _INSTAGRAM_STORY_PATH.match(path)
+        if match:
+            user, story_id = match.groups()
+            return MediaKey(
+                INSTAGRAM, story_id, f"https://www.instagram.com/stories/{user}/{story_id}/"
+            )
+    return None
+
+
+async def _follow_redirects(link: str) -> Optional[str]:
+    """Follow a short link hop by hop, reading only the Location headers."""
+    url = link if "://" in link else f"https://{link}"
+    client = get_http_client()
+    for _ in range(_MAX_REDIRECTS):
+        try:
+            response = await client.head(url, follow_redirects=False)
+            if response.status_code == 405:
+                async with client.stream("GET", url, follow_redirects=False) as streamed:
+                    response = streamed
+        except httpx.HTTPError as exc:
+            logger.warning("Failed to resolve short link %s: %s", link, exc)
+            return None
+        location = response.headers.get("location")
+        if response.status_code not in _REDIRECT_STATUSES or not location:
+            return url
+        url = urljoin(url, location)
+        if not is_short_link(url):
+            return url
+    return url
+
+
+async def resolve_short_link(link: str) -> Optional[str]:
+    cached = _resolved_links.get(link)
+    if cached:
+        return cached
+    resolved = await _follow_redirects(link)
+    # Only a redirect to a post is worth a day in the cache; a 200/403 answer
+    # (TikTok does that to datacenter IPs, Instagram shows a login page) may
+    # well redirect next time.
+    if resolved and not is_short_link(resolved) and parse_media_link(resolved) is not None:
+        _resolved_links.set(link, resolved)
+    return resolved
+
+
+def unresolved_media_key(link: str) -> Optional[MediaKey]:
+    """MediaKey for a short link we could not resolve ourselves.
+
+    The provider APIs resolve short links on their own, so the raw link is
+    still worth sending; it is identified by a hash of the link.
+    """
+    provider = detect_provider(link)
+    if provider is None or not is_short_link(link):
+        return None
+    cleaned = link.strip()
+    digest = hashlib.sha1(cleaned.encode()).hexdigest()[:16]
+    return MediaKey(provider, f"short-{digest}", cleaned)
+
+
+async def canonicalize(link: str) -> Optional[MediaKey]:
+    """Turn any supported TikTok/Instagram URL into its stable MediaKey."""
+    if is_short_link(link):
+        resolved = await resolve_short_link(link)
+        if not resolved:
+            return None
+        link = resolved
+    return parse_media_link(link)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import bisect
+import time
+from collections import Counter
+from typing import Dict, Optional, Sequence
+
+# Bucket upper bounds; the last bucket catches everything above.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(1024 * 4**power for power in range(11))  # 1 KiB .. 1 GiB
+
+
+class Histogram:
+    """Fixed-bucket histogram: O(1) memory per series, quantiles estimated from buckets."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the quantile (capped at the observed max)."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class RequestTrace:
+    """httpcore ``trace`` extension that timestamps connection and response phases.
+
+    httpcore resolves DNS inside ``connect_tcp``, so ``connect`` includes the
+    lookup; both stay at zero when a keep-alive connection is reused.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self._marks: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: dict) -> None:
+        self._marks.setdefault(event_name, time.perf_counter())
+
+    def _span(self, prefix: str) -> float:
+        started = self._marks.get(f"{prefix}.started")
+        completed = self._marks.get(f"{prefix}.complete")
+        if started is None or completed is None:
+            return 0.0
+        return completed - started
+
+    @property
+    def connect(self) -> float:
+        return self._span("connection.connect_tcp")
+
+    @property
+    def tls(self) -> float:
+        return self._span("connection.start_tls")
+
+    @property
+    def ttfb(self) -> Optional[float]:
+        for protocol in ("http11", "http2"):
+            event = f"{protocol}.receive_response_headers.complete"
+            if event in self._marks:
+                return self._marks[event] - self.started
+        return None
+
+
+class ProviderMetrics:
+    def __init__(self) -> None:
+        self.connect = Histogram(LATENCY_BUCKETS)
+        self.tls = Histogram(LATENCY_BUCKETS)
+        self.ttfb = Histogram(LATENCY_BUCKETS)
+        self.total = Histogram(LATENCY_BUCKETS)
+        self.payload = Histogram(SIZE_BUCKETS)
+        self.statuses: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.variants: Counter[str] = Counter()
+        self.new_connections = 0
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.total.count,
+            "new_conn": self.new_connections,
+            "connect_p95": round(self.connect.quantile(0.95), 3),
+            "tls_p95": round(self.tls.quantile(0.95), 3),
+            "ttfb_p50": round(self.ttfb.quantile(0.5), 3),
+            "ttfb_p95": round(self.ttfb.quantile(0.95), 3),
+            "total_p50": round(self.total.quantile(0.5), 3),
+            "total_p95": round(self.total.quantile(0.95), 3),
+            "total_p99": round(self.total.quantile(0.99), 3),
+            "total_max": round(self.total.max, 3),
+            "bytes_avg": int(self.payload.mean()),
+            "status": dict(self.statuses),
+            "errors": dict(self.errors),
+            "variants": dict(self.variants),
+        }
+
+
+class MediaMetrics:
+    """In-process metrics of the media pipeline, per provider and per platform cache."""
+
+    def __init__(self) -> None:
+        self._providers: Dict[str, ProviderMetrics] = {}
+        self._cache: Dict[str, Counter[str]] = {}
+
+    def provider(self, name: str) -> ProviderMetrics:
+        metrics = self._providers.get(name)
+        if metrics is None:
+            metrics = self._providers[name] = ProviderMetrics()
+        return metrics
+
+    def record_response(
+        self, provider: str, trace: RequestTrace, status: int, payload_bytes: int
+    ) -> None:
+        metrics = self.provider(provider)
+        metrics.total.observe(time.perf_counter() - trace.started)
+        if trace.connect:
+            metrics.new_connections += 1
+            metrics.connect.observe(trace.connect)
+        if trace.tls:
+            metrics.tls.observe(trace.tls)
+        if trace.ttfb is not None:
+            metrics.ttfb.observe(trace.ttfb)
+        metrics.payload.observe(payload_bytes)
+        metrics.statuses[str(status)] += 1
+
+    def record_error(self, provider: str, kind: str) -> None:
+        self.provider(provider).errors[kind] += 1
+
+    def record_variant(self, provider: str, variant: str) -> None:
+        self.provider(provider).variants[variant] += 1
+
+    def record_cache(self, platform: str, hit: bool) -> None:
+        self._cache.setdefault(platform, Counter())["hit" if hit else "miss"] += 1
+
+    def stats(self) -> Dict[str, dict]:
+        stats = {name: metrics.stats() for name, metrics in self._providers.items()}
+        for platform, counts in self._cache.items():
+            lookups = counts["hit"] + counts["miss"]
+            stats[f"{platform} cache"] = {
+                "hit": counts["hit"],
+                "miss": counts["miss"],
+                "hit_ratio": round(counts["hit"] / lookups, 3) if lookups else 0.0,
+            }
+        return stats
+
+
+media_metrics = MediaMetrics()
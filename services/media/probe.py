@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence
+
+import httpx
+
+from services.cache import TTLCache
+from services.media.http import get_http_client
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_RANGE_TOTAL = re.compile(r"/(\d+)\s*$")
+
+# CDN links stay valid for a while and a file's size never changes.
+_probes: TTLCache[str, "ProbeResult"] = TTLCache(max_entries=2048, ttl=60 * 60)
+
+
+@dataclass(frozen=True)
+class Variant:
+    """One downloadable rendition offered by a provider (hd, sd, watermarked)."""
+
+    name: str
+    url: str
+    size: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    size: Optional[int] = None
+    content_type: Optional[str] = None
+
+
+def _parse_size(response: httpx.Response) -> Optional[int]:
+    content_range = response.headers.get("content-range")
+    if content_range:
+        match = _CONTENT_RANGE_TOTAL.search(content_range)
+        if match:
+            return int(match.group(1))
+    if response.status_code == 200:
+        try:
+            return int(response.headers["content-length"])
+        except (KeyError, ValueError):
+            return None
+    return None
+
+
+def _parse_content_type(response: httpx.Response) -> Optional[str]:
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type or None
+
+
+async def probe(url: str, timeout: Optional[float] = None) -> ProbeResult:
+    """Return size and content type of ``url`` via HEAD, or a one-byte range GET as a fallback."""
+    cached = _probes.get(url)
+    if cached is not None:
+        return cached
+    if timeout is None:
+        timeout = get_settings().media_probe_timeout
+    client = get_http_client()
+    size = content_type = None
+    try:
+        response = await client.head(url, follow_redirects=True, timeout=timeout)
+        if response.status_code == 200:
+            size = _parse_size(response)
+            content_type = _parse_content_type(response)
+        if size is None:
+            async with client.stream(
+                "GET", url, headers={"Range": "bytes=0-0"}, follow_redirects=True, timeout=timeout
+            ) as response:
+                if response.status_code in (200, 206):
+                    size = _parse_size(response)
+                    content_type = content_type or _parse_content_type(response)
+    except httpx.HTTPError as exc:
+        logger.debug("Probe failed for %s: %r", url, exc)
+        return ProbeResult()
+    result = ProbeResult(size, content_type)
+    if size is not None:
+        _probes.set(url, result)
+    return result
+
+
+async def probe_all(urls: Iterable[str]) -> Dict[str, ProbeResult]:
+    """Probe several URLs concurrently."""
+    unique = list(dict.fromkeys(urls))
+    results = await asyncio.gather(*(probe(url) for url in unique))
+    return dict(zip(unique, results))
+
+
+async def probe_sizes(urls: Iterable[str]) -> Dict[str, Optional[int]]:
+    return {url: result.size for url, result in (await probe_all(urls)).items()}
+
+
+def pick_variant(
+    variants: Sequence[Variant], max_bytes: int, fallback_bytes: Optional[int] = None
+) -> Optional[Variant]:
+    """Pick the first (most preferred) variant that fits under ``max_bytes``.
+
+    Variants of unknown size are assumed to fit. Failing that, the first one
+    under ``fallback_bytes`` is taken (e.g. the re-upload limit). When none
+    fits, the smallest one is returned so the caller can still try to deliver
+    something.
+    """
+    if not variants:
+        return None
+    for limit in (max_bytes, fallback_bytes):
+        if limit is None:
+            continue
+        for variant in variants:
+            if variant.size is None or variant.size <= limit:
+                return variant
+    return min(variants, key=lambda variant: variant.size or 0)
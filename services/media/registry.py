@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import importlib
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from services.media.base import MediaDownloader, MediaInfo, ProviderError, download_cached
+from services.media.links import INSTAGRAM, TIKTOK, MediaKey, detect_provider
+from services.media.scheduler import SchedulerRejected
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Platform -> module with a ``build_providers(settings)`` function. Modules are
+# imported and providers built only when a link of that platform first shows up.
+PROVIDER_PLUGINS = {
+    TIKTOK: "services.media.tiktok",
+    INSTAGRAM: "services.media.instagram",
+}
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures, lets one probe through after ``cooldown``."""
+
+    def __init__(
+        self, threshold: int, cooldown: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.threshold = max(threshold, 1)
+        self.cooldown = cooldown
+        self._clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a request may go to the provider now (claims the probe in half-open)."""
+        if self.state == OPEN and self._clock() - self._opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self.state = OPEN
+            self._opened_at = self._clock()
+
+    def release(self) -> None:
+        """Give back a claimed probe without a verdict (e.g. the request never ran)."""
+        self._probing = False
+
+
+class ProviderHealth:
+    """EWMA latency and success rate of one provider plus its circuit breaker."""
+
+    def __init__(self, alpha: float, breaker: CircuitBreaker) -> None:
+        self.alpha = alpha
+        self.breaker = breaker
+        self.latency: Optional[float] = None
+        self.success_rate = 1.0
+        self.requests = 0
+
+    def _update(self, latency: float, success: float) -> None:
+        self.requests += 1
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.alpha * (latency - self.latency)
+        self.success_rate += self.alpha * (success - self.success_rate)
+
+    def record_success(self, latency: float) -> None:
+        self._update(latency, 1.0)
+        self.breaker.record_success()
+
+    def record_failure(self, latency: float) -> None:
+        self._update(latency, 0.0)
+        self.breaker.record_failure()
+
+    def score(self) -> float:
+        """Expected cost of a request: latency inflated by the failure rate (lower is better).
+
+        Providers without history score 0, so new ones get tried first.
+        """
+        if self.latency is None:
+            return 0.0
+        return self.latency / max(self.success_rate, 0.05)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "success_rate": round(self.success_rate, 3),
+            "failures": self.breaker.failures,
+            "requests": self.requests,
+        }
+
+
+class ProviderRegistry:
+    """Routes each platform's downloads across its providers.
+
+    Providers of a platform are built from its plugin on first use; a plugin
+    that builds nothing (e.g. no API key) leaves the platform disabled.
+    Registering a provider by hand takes the platform over from its plugin,
+    which is how fake providers are plugged in.
+
+    Healthy providers are tried in order of their score; a provider whose
+    breaker is open is skipped until its cooldown passes and one probe
+    request goes through. Only retryable failures count against a provider's
+    health; a link-level failure (private post) still falls through to the
+    next provider but leaves the breaker alone.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.3,
+        breaker_threshold: int = 3,
+        breaker_cooldown: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        plugins: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.alpha = alpha
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._clock = clock
+        self._providers: Dict[str, List[MediaDownloader]] = defaultdict(list)
+        self._health: Dict[str, ProviderHealth] = {}
+        self._plugins = dict(PROVIDER_PLUGINS if plugins is None else plugins)
+        self._loaded: set[str] = set()
+
+    def _load(self, platform: str) -> List[MediaDownloader]:
+        if platform not in self._loaded:
+            module_path = self._plugins.get(platform)
+            if module_path:
+                try:
+                    module = importlib.import_module(module_path)
+                    providers = list(module.build_providers(get_settings()))
+                except Exception:
+                    # Left unloaded, so the next link of the platform tries again.
+                    logger.exception("Failed to load %s providers from %s", platform, module_path)
+                    return []
+                for provider in providers:
+                    self.register(provider)
+                logger.info("Loaded %d %s provider(s)", len(providers), platform)
+            self._loaded.add(platform)
+        return self._providers.get(platform, [])
+
+    def enabled(self, platform: str) -> bool:
+        """Whether the platform has at least one configured provider."""
+        return bool(self._load(platform))
+
+    def register(self, provider: MediaDownloader) -> MediaDownloader:
+        if provider.name in self._health:
+            raise ValueError(f"Provider {provider.name} is already registered")
+        self._loaded.add(provider.platform)
+        self._providers[provider.platform].append(provider)
+        self._health[provider.name] = ProviderHealth(
+            self.alpha,
+            CircuitBreaker(self.breaker_threshold, self.breaker_cooldown, clock=self._clock),
+        )
+        return provider
+
+    def providers(self, platform: str) -> List[MediaDownloader]:
+        return list(self._load(platform))
+
+    def health(self, name: str) -> ProviderHealth:
+        return self._health[name]
+
+    def _ranked(self, platform: str) -> List[MediaDownloader]:
+        return sorted(self._load(platform), key=lambda p: self._health[p.name].score())
+
+    async def fetch(
+        self, platform: str, link: str, chat_id: Optional[int] = None
+    ) -> List[MediaInfo]:
+        """Fetch ``link`` from the best available provider, failing over on errors.
+
+        Raises ProviderError when every provider failed or was unavailable and
+        SchedulerRejected when every attempted provider's queue was full.
+        """
+        last_error: Optional[Exception] = None
+        for provider in self._ranked(platform):
+            health = self._health[provider.name]
+            if not health.breaker.allow():
+                continue
+            started = self._clock()
+            try:
+                items = await provider.fetch(link, chat_id)
+            except SchedulerRejected as exc:
+                health.breaker.release()
+                last_error = exc
+                continue
+            except ProviderError as exc:
+                if exc.retryable:
+                    health.record_failure(self._clock() - started)
+                else:
+                    health.breaker.release()
+                logger.warning("Provider %s failed, trying the next one: %s", provider.name, exc)
+                last_error = exc
+                continue
+            except BaseException:
+                health.breaker.release()
+                raise
+            health.record_success(self._clock() - started)
+            return items
+
+        if last_error is not None:
+            raise last_error
+        if self._providers.get(platform):
+            raise ProviderError(platform, "all circuit breakers are open")
+        raise ProviderError(platform, "no providers registered")
+
+    async def download(
+        self,
+        link: str,
+        chat_id: Optional[int] = None,
+        media_key: Optional[MediaKey] = None,
+    ) -> Optional[List[MediaInfo]]:
+        """Resolve a link through the shared cache, routing a miss across providers.
+
+        ``media_key`` is the link's already computed MediaKey, if the caller has one.
+        Raises SchedulerRejected when the provider queues are too long and
+        ProviderError when every provider failed for a retryable reason.
+        """
+        platform = detect_provider(link)
+        if platform is None or not self.enabled(platform):
+            logger.warning("No provider registered for %s", link)
+            return None
+        return await download_cached(
+            link, lambda url: self.fetch(platform, url, chat_id), media_key
+        )
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: health.stats() for name, health in self._health.items()}
+
+
+def mirror_hosts(raw: str) -> List[str]:
+    """Parse a comma-separated list of extra RapidAPI hosts serving the same API."""
+    return [host.strip() for host in raw.split(",") if host.strip()]
+
+
+def _build_registry() -> ProviderRegistry:
+    settings = get_settings()
+    return ProviderRegistry(
+        alpha=settings.media_health_alpha,
+        breaker_threshold=settings.media_breaker_threshold,
+        breaker_cooldown=settings.media_breaker_cooldown,
+    )
+
+
+media_registry = _build_registry()
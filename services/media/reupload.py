@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import tempfile
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, BinaryIO
+
+import httpx
+
+from services.media.http import get_http_client
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaFetchError(Exception):
+    """The media file itself could not be downloaded from the provider's CDN."""
+
+
+class MediaTooLarge(MediaFetchError):
+    """The media file is bigger than we are willing to re-upload."""
+
+
+class ByteBudget:
+    """Async semaphore counted in bytes, shared by all concurrent re-uploads.
+
+    A reservation larger than the whole budget is clamped to it, so a single
+    big file still goes through, just alone.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(capacity, 1)
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, amount: int) -> AsyncIterator[None]:
+        amount = min(max(amount, 0), self.capacity)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use + amount <= self.capacity)
+            self.in_use += amount
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_use -= amount
+                self._condition.notify_all()
+
+
+reupload_budget = ByteBudget(get_settings().media_reupload_budget_bytes)
+
+
+def _content_length(response: httpx.Response) -> int:
+    try:
+        return max(int(response.headers.get("content-length", "0")), 0)
+    except ValueError:
+        return 0
+
+
+@asynccontextmanager
+async def spooled_download(url: str) -> AsyncIterator[BinaryIO]:
+    """Stream ``url`` into a spooled temp file and yield it rewound.
+
+    Files below MEDIA_REUPLOAD_SPOOL_BYTES stay in memory, bigger ones roll
+    over to disk. The byte budget is held until the caller is done with the
+    file, and the file is closed (and deleted) on every exit path.
+    """
+    settings = get_settings()
+    max_bytes = settings.media_reupload_max_bytes
+    async with AsyncExitStack() as stack:
+        handle = stack.enter_context(
+            tempfile.SpooledTemporaryFile(max_size=settings.media_reupload_spool_bytes)
+        )
+        try:
+            async with get_http_client().stream("GET", url, follow_redirects=True) as response:
+                if response.status_code != 200:
+                    raise MediaFetchError(f"{url} answered {response.status_code}")
+                expected = _content_length(response)
+                if expected > max_bytes:
+                    raise MediaTooLarge(f"{url} is {expected} bytes, limit is {max_bytes}")
+                limit = expected or max_bytes
+                await stack.enter_async_context(reupload_budget.reserve(limit))
+                received = 0
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > limit:
+                        raise MediaTooLarge(f"{url} is larger than {limit} bytes")
+                    handle.write(chunk)
+        except httpx.HTTPError as exc:
+            raise MediaFetchError(f"{url} download failed: {exc!r}") from exc
+        logger.info("Downloaded %s bytes for re-upload", received)
+        handle.seek(0)
+        yield handle
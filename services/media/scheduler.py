@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerRejected(Exception):
+    """A media request waited in the provider queue longer than allowed."""
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, at most ``burst`` stored."""
+
+    def __init__(
+        self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 when one is available now)."""
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self._tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self._tokens -= 1
+
+
+@dataclass(order=True)
+class _Ticket:
+    finish: float
+    seq: int
+    chat_id: Optional[int] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+class ProviderQueue:
+    """Weighted fair queue across chats, drained at the provider's token-bucket rate.
+
+    Each request gets a virtual finish time ``max(now_v, last_finish[chat]) +
+    1 / weight``; the dispatcher always grants the smallest one, so a chat
+    that floods the queue only delays itself.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_wait: float) -> None:
+        self.name = name
+        self.max_wait = max_wait
+        self._bucket = TokenBucket(rate, burst)
+        self._heap: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[Optional[int], float] = {}
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._waits: deque[float] = deque(maxlen=500)
+        self.granted = 0
+        self.rejected = 0
+
+    def depth(self) -> int:
+        return sum(1 for ticket in self._heap if not ticket.future.done())
+
+    async def acquire(self, chat_id: Optional[int], weight: float = 1.0) -> None:
+        start = max(self._virtual_time, self._last_finish.get(chat_id, 0.0))
+        finish = start + 1.0 / max(weight, 0.01)
+        self._last_finish[chat_id] = finish
+        loop = asyncio.get_running_loop()
+        ticket = _Ticket(finish, next(self._seq), chat_id, loop.create_future(), loop.time())
+        heapq.heappush(self._heap, ticket)
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await asyncio.wait_for(ticket.future, self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning(
+                "%s queue wait exceeded %.1fs for chat %s", self.name, self.max_wait, chat_id
+            )
+            raise SchedulerRejected(self.name) from None
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._heap:
+            ticket = self._heap[0]
+            if ticket.future.done():
+                heapq.heappop(self._heap)
+                continue
+            delay = self._bucket.delay()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            self._bucket.take()
+            self._virtual_time = ticket.finish
+            self._waits.append(loop.time() - ticket.enqueued_at)
+            self.granted += 1
+            ticket.future.set_result(None)
+        # Everything queued so far has been served; per-chat history can go.
+        self._last_finish.clear()
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "depth": self.depth(),
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "wait_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "wait_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3)
+            if waits
+            else 0.0,
+            "wait_max": round(waits[-1], 3) if waits else 0.0,
+        }
+
+
+def _parse_rates(raw: str) -> Dict[str, tuple[float, float]]:
+    """Parse ``provider:rate:burst`` pairs separated by commas."""
+    rates: Dict[str, tuple[float, float]] = {}
+    for item in raw.split(","):
+        parts = item.strip().split(":")
+        if len(parts) != 3:
+            continue
+        try:
+            rates[parts[0].strip()] = (float(parts[1]), float(parts[2]))
+        except ValueError:
+            logger.warning("Ignoring malformed MEDIA_PROVIDER_RATES entry: %s", item)
+    return rates
+
+
+def _parse_weights(raw: str) -> Dict[int, float]:
+    """Parse ``chat_id:weight`` pairs separated by commas."""
+    weights: Dict[int, float] = {}
+    for item in raw.split(","):
+        chat_id, _, weight = item.strip().partition(":")
+        try:
+            weights[int(chat_id)] = float(weight)
+        except ValueError:
+            continue
+    return weights
+
+
+class MediaScheduler:
+    """Per-provider token buckets with per-chat fair queuing in front of RapidAPI."""
+
+    def __init__(self) -> None:
+        settings = get_settings()
+        self._rates = _parse_rates(settings.media_provider_rates)
+        self._default_rate = (settings.media_rate_per_second, settings.media_rate_burst)
+        self._weights = _parse_weights(settings.media_chat_weights)
+        self._max_wait = settings.media_queue_max_wait
+        self._queues: Dict[str, ProviderQueue] = {}
+
+    def _queue(self, provider: str) -> ProviderQueue:
+        queue = self._queues.get(provider)
+        if queue is None:
+            rate, burst = self._rates.get(provider, self._default_rate)
+            queue = ProviderQueue(provider, rate, burst, self._max_wait)
+            self._queues[provider] = queue
+        return queue
+
+    async def acquire(self, provider: str, chat_id: Optional[int] = None) -> None:
+        """Wait for the provider's turn; raises SchedulerRejected after max wait."""
+        weight = self._weights.get(chat_id, 1.0) if chat_id is not None else 1.0
+        await self._queue(provider).acquire(chat_id, weight)
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: queue.stats() for name, queue in self._queues.items()}
+
+
+media_scheduler = MediaScheduler()
@@ -1,24 +1,45 @@
 import logging
-import re
+from dataclasses import replace
 from typing import Optional
 
-from services.media.base import MediaDownloader, MediaInfo
+from services.media.base import DEFAULT_QUOTA, MediaDownloader, MediaInfo, quota_key
+from services.media.links import TIKTOK
+from services.media.probe import Variant, pick_variant, probe_sizes
+from services.media.registry import media_registry, mirror_hosts
 from services.usage import UsageTracker
-from utils.settings import get_settings
+from utils.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+# Payload fields of each rendition and of its size, best quality first.
+_VARIANTS = (("hdplay", "hd_size"), ("play", "size"), ("wmplay", "wm_size"))
+_WATERMARKED = "wmplay"
 
-def findLink(text):
-    answer = re.search(r'[(http://)|\w]*?[\w]*\.[-/\w]*\.\w*[(/{1})]?[#-\./\w]*[(/{1,})]?', text)
-    if answer is not None:
-        return answer.group()
-    return None
 
 class TikTokDownloader(MediaDownloader):
+    name = "tiktok"
+    platform = TIKTOK
     api_url = "https://tiktok-video-no-watermark2.p.rapidapi.com/"
     api_host = "tiktok-video-no-watermark2.p.rapidapi.com"
 
-    def __init__(self, api_key: str, hd: bool = True) -> None:
-        super().__init__(api_key)
+    def __init__(
+        self,
+        api_key: str,
+        hd: bool = True,
+        usage_tracker: Optional[UsageTracker] = None,
+        max_bytes: Optional[int] = None,
+        reupload_max_bytes: Optional[int] = None,
+        probe: Optional[bool] = None,
+        **overrides,
+    ) -> None:
+        super().__init__(api_key, usage_tracker=usage_tracker, **overrides)
+        settings = get_settings()
         self.hd = hd
+        self.max_bytes = settings.media_max_bytes if max_bytes is None else max_bytes
+        self.reupload_max_bytes = (
+            settings.media_reupload_max_bytes if reupload_max_bytes is None else reupload_max_bytes
+        )
+        self.probe = settings.media_probe_sizes if probe is None else probe
 
     def build_query(self, link: str) -> dict:
         query = super().build_query(link)
@@ -26,27 +47,68 @@ class TikTokDownloader(MediaDownloader):
             query["hd"] = 1
         return query
 
-    def extract_media(self, payload: dict):
+    def variants(self, payload: dict) -> list[Variant]:
+        """Candidate renditions in order of preference, with the sizes the API reports."""
         data = payload.get("data") or {}
-        if self.hd:
-            hd_url = data.get("hdplay")
-            if hd_url:
-                return MediaInfo(url=hd_url)
-        play_url = data.get("play")
-        if play_url:
-            return MediaInfo(url=play_url)
-        return None
+        variants = []
+        for name, size_field in _VARIANTS:
+            if name == "hdplay" and not self.hd:
+                continue
+            url = data.get(name)
+            if not url:
+                continue
+            size = data.get(size_field)
+            if not isinstance(size, int) or size <= 0:
+                size = None
+            variants.append(Variant(name, url, size))
+        return variants
 
+    def _choose(self, variants: list[Variant]) -> list[MediaInfo]:
+        # The watermarked rendition is only a last resort: a clean one too big
+        # for Telegram to fetch by URL is still delivered by re-uploading it.
+        clean = [variant for variant in variants if variant.name != _WATERMARKED]
+        variant = pick_variant(clean or variants, self.max_bytes, self.reupload_max_bytes)
+        if variant is None:
+            return []
+        return [MediaInfo(url=variant.url, size=variant.size, variant=variant.name)]
+
+    def extract_media(self, payload: dict) -> list[MediaInfo]:
+        return self._choose(self.variants(payload))
+
+    async def resolve_media(self, payload: dict) -> list[MediaInfo]:
+        variants = self.variants(payload)
+        if self.probe and variants:
+            sizes = await probe_sizes(variant.url for variant in variants)
+            variants = [
+                replace(variant, size=sizes.get(variant.url) or variant.size)
+                for variant in variants
+            ]
+        return self._choose(variants)
 
-logger = logging.getLogger(__name__)
 
-settings = get_settings()
-tiktok_downloader = TikTokDownloader(settings.tiktok_api_key)
-usage_tracker = UsageTracker(key="tiktok_requests_remaining", limit=150)
+def build_providers(settings: Settings) -> list[MediaDownloader]:
+    """TikTok providers for the registry; none when TIKTOK_KEY is not set."""
+    if not settings.tiktok_api_key:
+        logger.warning("TIKTOK_KEY is not set; TikTok downloads are disabled")
+        return []
+    providers: list[MediaDownloader] = [
+        TikTokDownloader(
+            settings.tiktok_api_key,
+            usage_tracker=UsageTracker(key=quota_key(TIKTOK), limit=DEFAULT_QUOTA),
+        )
+    ]
+    for host in mirror_hosts(settings.tiktok_mirror_hosts):
+        providers.append(
+            TikTokDownloader(
+                settings.tiktok_api_key,
+                usage_tracker=UsageTracker(key=quota_key(TIKTOK, host)),
+                name=f"tiktok:{host}",
+                api_url=f"https://{host}/",
+                api_host=host,
+            )
+        )
+    return providers
 
 
-async def downloadTikTok(link) -> Optional[MediaInfo]:
-    if not usage_tracker.consume():
-        logger.warning("TikTok request limit reached; skipping download.")
-        return None
-    return await tiktok_downloader.download(link)
+async def downloadTikTok(link, chat_id: Optional[int] = None) -> Optional[list[MediaInfo]]:
+    return await media_registry.download(link, chat_id)
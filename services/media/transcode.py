@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Optional
+
+from utils.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+AUDIO_KBPS = 96
+MIN_VIDEO_KBPS = 150
+# Below this video bitrate 720p looks worse than a clean 480p.
+LOW_BITRATE_KBPS = 800
+LOW_BITRATE_HEIGHT = 480
+# Leave room for the MP4 container and x264 overshooting the average bitrate.
+SIZE_MARGIN = 0.9
+# Lower priority than the bot itself, so the event loop keeps its CPU share.
+NICENESS = 10
+# Give up on a provider CDN that stops sending (microseconds, ffmpeg's unit).
+INPUT_TIMEOUT_US = 15_000_000
+
+
+class TranscodeError(Exception):
+    """ffmpeg could not bring the video under the size limit."""
+
+
+class TranscodeBusy(TranscodeError):
+    """Too many videos are already waiting for a transcoding slot."""
+
+
+def video_bitrate(duration: float, target_bytes: int) -> int:
+    """Video bitrate (kbit/s) that makes ``duration`` seconds fit into ``target_bytes``."""
+    total_kbps = target_bytes * 8 * SIZE_MARGIN / max(duration, 1.0) / 1000
+    return int(total_kbps - AUDIO_KBPS)
+
+
+class Transcoder:
+    """Runs ffmpeg subprocesses, at most ``workers`` at a time.
+
+    Jobs beyond that wait for a slot; once ``queue_size`` jobs are waiting,
+    new ones are rejected with TranscodeBusy instead of piling up. Every
+    process is niced, limited to ``threads`` encoder threads and killed after
+    ``cpu_seconds`` of CPU time or ``timeout`` seconds of wall time.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        cpu_seconds: int,
+        threads: int,
+        timeout: float,
+        max_height: int,
+    ) -> None:
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 0)
+        self.cpu_seconds = cpu_seconds
+        self.threads = max(threads, 1)
+        self.timeout = timeout
+        self.max_height = max_height
+        self._slots = asyncio.Semaphore(self.workers)
+        self.waiting = 0
+        self.active = 0
+        self.done = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _limits(self) -> list[str]:
+        """Command prefix that lowers priority and caps CPU time.
+
+        Both tools exec the command in place, so signals and the exit status
+        are those of ffmpeg itself. Unlike a preexec_fn this is safe while
+        other threads of the bot are running.
+        """
+        prefix = ["nice", "-n", str(NICENESS)]
+        if self.cpu_seconds > 0:
+            prefix += ["prlimit", f"--cpu={self.cpu_seconds}:{self.cpu_seconds + 5}", "--"]
+        return prefix
+
+    async def _run(self, *args: str) -> bytes:
+        process = await asyncio.create_subprocess_exec(
+            *self._limits(),
+            *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            raise TranscodeError(f"{args[0]} timed out after {self.timeout:.0f}s")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        if process.returncode < 0:
+            # SIGXCPU means the job used up its CPU budget.
+            raise TranscodeError(f"{args[0]} was killed by signal {-process.returncode}")
+        if process.returncode != 0:
+            message = stderr.decode(errors="replace").strip().splitlines()
+            raise TranscodeError(
+                f"{args[0]} exited with {process.returncode}: {message[-1] if message else ''}"
+            )
+        return stdout
+
+    async def _duration(self, source: str) -> float:
+        output = await self._run(
+            "ffprobe",
+            "-v", "error",
+            "-rw_timeout", str(INPUT_TIMEOUT_US),
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            source,
+        )
+        try:
+            return float(output.decode().strip())
+        except ValueError:
+            raise TranscodeError(f"ffprobe reported no duration for {source}")
+
+    async def _encode(self, source: str, output: Path, target_bytes: int) -> None:
+        duration = await self._duration(source)
+        kbps = video_bitrate(duration, target_bytes)
+        if kbps < MIN_VIDEO_KBPS:
+            raise TranscodeError(
+                f"{duration:.0f}s video needs {kbps} kbit/s to fit into {target_bytes} bytes"
+            )
+        height = self.max_height if kbps >= LOW_BITRATE_KBPS else min(
+            self.max_height, LOW_BITRATE_HEIGHT
+        )
+        logger.info(
+            "Transcoding %.0fs video to %d kbit/s, %dp (limit %d bytes)",
+            duration,
+            kbps,
+            height,
+            target_bytes,
+        )
+        await self._run(
+            "ffmpeg",
+            "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+            "-rw_timeout", str(INPUT_TIMEOUT_US),
+            "-i", source,
+            "-threads", str(self.threads),
+            "-vf", f"scale=-2:'min({height},ih)'",
+            "-c:v", "libx264", "-preset", "veryfast",
+            "-b:v", f"{kbps}k", "-maxrate", f"{kbps}k", "-bufsize", f"{kbps * 2}k",
+            "-c:a", "aac", "-b:a", f"{AUDIO_KBPS}k",
+            "-movflags", "+faststart",
+            str(output),
+        )
+        size = output.stat().st_size
+        if size > target_bytes:
+            raise TranscodeError(f"transcoded file is {size} bytes, limit is {target_bytes}")
+
+    @asynccontextmanager
+    async def transcoded(self, source: str, target_bytes: int) -> AsyncIterator[BinaryIO]:
+        """Re-encode ``source`` (a URL or path) to fit ``target_bytes`` and yield the file.
+
+        The result lives in a temporary directory that is removed on exit.
+        """
+        if self.waiting >= self.queue_size and self._slots.locked():
+            self.rejected += 1
+            raise TranscodeBusy(f"{self.waiting} videos are already waiting for ffmpeg")
+        with tempfile.TemporaryDirectory(prefix="transcode-") as directory:
+            output = Path(directory) / "video.mp4"
+            self.waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            try:
+                await self._encode(source, output, target_bytes)
+            except TranscodeError:
+                self.failed += 1
+                raise
+            finally:
+                self.active -= 1
+                self._slots.release()
+            self.done += 1
+            with output.open("rb") as handle:
+                yield handle
+
+    def stats(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "active": self.active,
+            "workers": self.workers,
+            "done": self.done,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+def _build_transcoder() -> Optional[Transcoder]:
+    settings = get_settings()
+    if not settings.media_transcode:
+        return None
+    binaries = ["ffmpeg", "ffprobe", "nice"]
+    if settings.media_transcode_cpu_seconds > 0:
+        binaries.append("prlimit")
+    missing = [binary for binary in binaries if shutil.which(binary) is None]
+    if missing:
+        logger.warning("MEDIA_TRANSCODE is enabled but %s not found; transcoding is off", missing)
+        return None
+    return Transcoder(
+        settings.media_transcode_workers,
+        settings.media_transcode_queue_size,
+        settings.media_transcode_cpu_seconds,
+        settings.media_transcode_threads,
+        settings.media_transcode_timeout,
+        settings.media_transcode_max_height,
+    )
+
+
+# None when transcoding is disabled or ffmpeg is not installed.
+transcoder = _build_transcoder()
@@ -1,45 +1,290 @@
+from __future__ import annotations
+
+import asyncio
 import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Mapping, Optional
 
+from services.database import get_database
+from utils.settings import get_settings
 
-class UsageTracker:
-    def __init__(
-        self,
-        key: str,
-        limit: int,
-        storage_path: Path | str = Path("data/usage.json"),
-    ) -> None:
-        self.key = key
-        self.limit = limit
+logger = logging.getLogger(__name__)
+
+
+class QuotaStore(ABC):
+    """Async storage for request counters shared by UsageTracker instances."""
+
+    @abstractmethod
+    async def consume(self, key: str, limit: int) -> bool:
+        """Atomically take one unit; a missing counter starts at ``limit``."""
+
+    @abstractmethod
+    async def remaining(self, key: str, limit: int) -> int:
+        """Return the units left for ``key``."""
+
+    @abstractmethod
+    async def set_remaining(self, key: str, remaining: int) -> None:
+        """Overwrite the counter, e.g. on a reset."""
+
+    async def close(self) -> None:
+        """Flush pending state and release resources."""
+
+
+class FileQuotaStore(QuotaStore):
+    """JSON-file store: counters live in memory, flushed write-behind on a timer.
+
+    Writes go to a temporary file that is renamed over the original, so a
+    crash mid-flush never leaves a truncated file behind. File I/O runs in a
+    worker thread to keep the event loop free.
+    """
+
+    def __init__(self, storage_path: Path | str, flush_interval: float = 5.0) -> None:
         self.storage_path = Path(storage_path)
-        self._data = self._load()
+        self.flush_interval = flush_interval
+        self._data: Optional[Dict[str, int]] = None
+        self._lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
 
-    def _load(self) -> Dict[str, int]:
+    def _read(self) -> Dict[str, int]:
         self.storage_path.parent.mkdir(parents=True, exist_ok=True)
         if self.storage_path.is_file():
             try:
                 return json.loads(self.storage_path.read_text())
             except json.JSONDecodeError:
+                logger.warning("Usage file %s is corrupted; starting over", self.storage_path)
+        return {}
+
+    def _write(self, data: Dict[str, int]) -> None:
+        tmp_path = self.storage_path.with_suffix(self.storage_path.suffix + ".tmp")
+        with open(tmp_path, "w") as handle:
+            handle.write(json.dumps(data, indent=2))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self.storage_path)
+
+    async def _loaded(self) -> Dict[str, int]:
+        if self._data is None:
+            self._data = await asyncio.to_thread(self._read)
+        return self._data
+
+    def _mark_dirty(self) -> None:
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        # Shielded so close() can cancel the wait without abandoning a write.
+        await asyncio.shield(self.flush())
+
+    async def flush(self) -> None:
+        async with self._write_lock:
+            async with self._lock:
+                if not self._dirty or self._data is None:
+                    return
+                snapshot = dict(self._data)
+                self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, snapshot)
+            except OSError as exc:
+                logger.exception("Failed to persist usage to %s: %s", self.storage_path, exc)
+                self._dirty = True
+
+    async def consume(self, key: str, limit: int) -> bool:
+        async with self._lock:
+            data = await self._loaded()
+            remaining = data.get(key, limit)
+            if remaining <= 0:
+                return False
+            data[key] = remaining - 1
+            self._mark_dirty()
+            return True
+
+    async def remaining(self, key: str, limit: int) -> int:
+        async with self._lock:
+            data = await self._loaded()
+            return data.get(key, limit)
+
+    async def set_remaining(self, key: str, remaining: int) -> None:
+        async with self._lock:
+            data = await self._loaded()
+            data[key] = remaining
+            self._mark_dirty()
+
+    async def close(self) -> None:
+        task, self._flush_task = self._flush_task, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
                 pass
-        return {self.key: self.limit}
+        await self.flush()
+
+
+class PostgresQuotaStore(QuotaStore):
+    """Store backed by the quotas table; safe across several bot replicas."""
+
+    async def consume(self, key: str, limit: int) -> bool:
+        remaining = await get_database().consume_quota(key, limit)
+        return remaining is not None
+
+    async def remaining(self, key: str, limit: int) -> int:
+        return await get_database().get_quota(key, limit)
+
+    async def set_remaining(self, key: str, remaining: int) -> None:
+        await get_database().set_quota(key, remaining)
+
+
+_store: Optional[QuotaStore] = None
+
+
+def get_quota_store() -> QuotaStore:
+    """Return the configured quota store (QUOTA_BACKEND=file|postgres)."""
+    global _store
+    if _store is None:
+        settings = get_settings()
+        if settings.quota_backend == "postgres":
+            _store = PostgresQuotaStore()
+        else:
+            _store = FileQuotaStore(
+                settings.quota_file_path, flush_interval=settings.quota_flush_interval
+            )
+    return _store
+
+
+async def close_quota_store() -> None:
+    global _store
+    store, _store = _store, None
+    if store is not None:
+        await store.close()
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """RapidAPI quota as reported by the ``x-ratelimit-requests-*`` response headers."""
+
+    remaining: int
+    limit: Optional[int] = None
+    reset_in: Optional[float] = None
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> Optional["RateLimit"]:
+        remaining = _header_number(headers, "x-ratelimit-requests-remaining")
+        if remaining is None:
+            return None
+        limit = _header_number(headers, "x-ratelimit-requests-limit")
+        reset_in = _header_number(headers, "x-ratelimit-requests-reset")
+        return cls(
+            remaining=max(int(remaining), 0),
+            limit=int(limit) if limit is not None else None,
+            reset_in=reset_in,
+        )
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class UsageTracker:
+    """Local request budget, reconciled with RapidAPI's rate-limit headers.
+
+    The reset time and the plan limit reported by the provider are kept in
+    the same store under ``<key>:reset_at`` (unix seconds) and ``<key>:limit``,
+    so they survive restarts; once the reset time passes, the counter is
+    refilled to the known limit on the next check.
+
+    A tracker created without a ``limit`` does not restrict requests until a
+    response has reported the real plan limit.
+    """
+
+    def __init__(
+        self, key: str, limit: Optional[int] = None, store: Optional[QuotaStore] = None
+    ) -> None:
+        self.key = key
+        self.limit = limit
+        self._store = store
+        self._reset_at: Optional[int] = None
+        self._limit_loaded = False
+
+    @property
+    def store(self) -> QuotaStore:
+        return self._store or get_quota_store()
+
+    @property
+    def _reset_key(self) -> str:
+        return f"{self.key}:reset_at"
+
+    @property
+    def _limit_key(self) -> str:
+        return f"{self.key}:limit"
+
+    async def _load_limit(self) -> Optional[int]:
+        """The limit last reported by the provider overrides the configured default."""
+        if not self._limit_loaded:
+            self._limit_loaded = True
+            reported = await self.store.remaining(self._limit_key, 0)
+            if reported > 0:
+                self.limit = reported
+        return self.limit
+
+    async def _refill_if_due(self) -> None:
+        if self._reset_at is None:
+            self._reset_at = await self.store.remaining(self._reset_key, 0)
+        if self._reset_at and time.time() >= self._reset_at:
+            self._reset_at = 0
+            await self.store.set_remaining(self._reset_key, 0)
+            if self.limit is not None:
+                logger.info("Quota %s reset window passed; refilling to %d", self.key, self.limit)
+                await self.store.set_remaining(self.key, self.limit)
 
-    def _save(self) -> None:
-        self.storage_path.write_text(json.dumps(self._data, indent=2))
+    async def remaining(self) -> Optional[int]:
+        """Requests left, or None while the limit is unknown."""
+        limit = await self._load_limit()
+        await self._refill_if_due()
+        if limit is None:
+            return None
+        return await self.store.remaining(self.key, limit)
 
-    def remaining(self) -> int:
-        return self._data.get(self.key, self.limit)
+    async def can_consume(self) -> bool:
+        remaining = await self.remaining()
+        return remaining is None or remaining > 0
 
-    def can_consume(self) -> bool:
-        return self.remaining() > 0
+    async def consume(self) -> bool:
+        limit = await self._load_limit()
+        await self._refill_if_due()
+        if limit is None:
+            return True
+        return await self.store.consume(self.key, limit)
 
-    def consume(self) -> bool:
-        if not self.can_consume():
-            return False
-        self._data[self.key] = self.remaining() - 1
-        self._save()
-        return True
+    async def reset(self) -> None:
+        limit = await self._load_limit()
+        if limit is not None:
+            await self.store.set_remaining(self.key, limit)
 
-    def reset(self) -> None:
-        self._data[self.key] = self.limit
-        self._save()
+    async def sync(self, rate_limit: RateLimit) -> None:
+        """Adopt the provider's view of the quota and schedule the next refill."""
+        await self._load_limit()
+        if rate_limit.limit and rate_limit.limit != self.limit:
+            self.limit = rate_limit.limit
+            await self.store.set_remaining(self._limit_key, rate_limit.limit)
+        await self.store.set_remaining(self.key, rate_limit.remaining)
+        if rate_limit.reset_in is not None:
+            reset_at = int(time.time() + rate_limit.reset_in)
+            # Reset headers count down in whole seconds; skip writes for jitter.
+            if self._reset_at is None or abs(reset_at - self._reset_at) > 5:
+                self._reset_at = reset_at
+                await self.store.set_remaining(self._reset_key, reset_at)
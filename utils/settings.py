@@ -9,6 +9,10 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _env_bool(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+
 @dataclass
 class Settings:
     telegram_bot_token: str
@@ -24,7 +28,58 @@ class Settings:
     db_name: str
     db_user: str
     db_password: str
+    db_cache_users_ttl: float
+    db_cache_users_size: int
+    db_cache_chats_ttl: float
+    db_cache_chats_size: int
+    db_cache_groups_ttl: float
+    db_cache_groups_size: int
     admin_user_id: int
+    media_http_max_connections: int
+    media_http_max_keepalive: int
+    media_http_keepalive_expiry: float
+    media_http2: bool
+    media_connect_timeout: float
+    media_read_timeout: float
+    media_cache_ttl: float
+    media_cache_size: int
+    media_file_id_ttl_days: int
+    media_links_concurrency: int
+    quota_backend: str
+    quota_file_path: str
+    quota_flush_interval: float
+    media_rate_per_second: float
+    media_rate_burst: float
+    media_provider_rates: str
+    media_chat_weights: str
+    media_queue_max_wait: float
+    tiktok_mirror_hosts: str
+    instagram_mirror_hosts: str
+    media_health_alpha: float
+    media_breaker_threshold: int
+    media_breaker_cooldown: float
+    media_reupload_max_bytes: int
+    media_reupload_budget_bytes: int
+    media_reupload_spool_bytes: int
+    media_max_bytes: int
+    media_probe_sizes: bool
+    media_probe_timeout: float
+    media_workers: int
+    media_queue_size: int
+    media_queue_put_timeout: float
+    media_drain_timeout: float
+    media_retry_interval: float
+    media_retry_batch: int
+    media_retry_max_attempts: int
+    media_retry_base_delay: float
+    media_retry_max_delay: float
+    media_transcode: bool
+    media_transcode_workers: int
+    media_transcode_queue_size: int
+    media_transcode_cpu_seconds: int
+    media_transcode_threads: int
+    media_transcode_timeout: float
+    media_transcode_max_height: int
 
     @classmethod
     def from_env(cls) -> "Settings":
@@ -43,17 +98,64 @@ class Settings:
             db_name=os.getenv("DATABASE_NAME", ""),
             db_user=os.getenv("DATABASE_USER", ""),
             db_password=os.getenv("DATABASE_PASSWORD", ""),
+            db_cache_users_ttl=float(os.getenv("DB_CACHE_USERS_TTL", "300")),
+            db_cache_users_size=int(os.getenv("DB_CACHE_USERS_SIZE", "5000")),
+            db_cache_chats_ttl=float(os.getenv("DB_CACHE_CHATS_TTL", "600")),
+            db_cache_chats_size=int(os.getenv("DB_CACHE_CHATS_SIZE", "1000")),
+            db_cache_groups_ttl=float(os.getenv("DB_CACHE_GROUPS_TTL", "300")),
+            db_cache_groups_size=int(os.getenv("DB_CACHE_GROUPS_SIZE", "5000")),
             admin_user_id=int(os.getenv("ADMIN_USER_ID", "0")),
+            media_http_max_connections=int(os.getenv("MEDIA_HTTP_MAX_CONNECTIONS", "20")),
+            media_http_max_keepalive=int(os.getenv("MEDIA_HTTP_MAX_KEEPALIVE", "10")),
+            media_http_keepalive_expiry=float(os.getenv("MEDIA_HTTP_KEEPALIVE_EXPIRY", "30")),
+            media_http2=_env_bool("MEDIA_HTTP2"),
+            media_connect_timeout=float(os.getenv("MEDIA_CONNECT_TIMEOUT", "5")),
+            media_read_timeout=float(os.getenv("MEDIA_READ_TIMEOUT", "30")),
+            media_cache_ttl=float(os.getenv("MEDIA_CACHE_TTL", "900")),
+            media_cache_size=int(os.getenv("MEDIA_CACHE_SIZE", "512")),
+            media_file_id_ttl_days=int(os.getenv("MEDIA_FILE_ID_TTL_DAYS", "30")),
+            media_links_concurrency=int(os.getenv("MEDIA_LINKS_CONCURRENCY", "3")),
+            quota_backend=os.getenv("QUOTA_BACKEND", "file").strip().lower(),
+            quota_file_path=os.getenv("QUOTA_FILE_PATH", "data/usage.json"),
+            quota_flush_interval=float(os.getenv("QUOTA_FLUSH_INTERVAL", "5")),
+            media_rate_per_second=float(os.getenv("MEDIA_RATE_PER_SECOND", "2")),
+            media_rate_burst=float(os.getenv("MEDIA_RATE_BURST", "5")),
+            media_provider_rates=os.getenv("MEDIA_PROVIDER_RATES", ""),
+            media_chat_weights=os.getenv("MEDIA_CHAT_WEIGHTS", ""),
+            media_queue_max_wait=float(os.getenv("MEDIA_QUEUE_MAX_WAIT", "30")),
+            tiktok_mirror_hosts=os.getenv("TIKTOK_MIRROR_HOSTS", ""),
+            instagram_mirror_hosts=os.getenv("INSTAGRAM_MIRROR_HOSTS", ""),
+            media_health_alpha=float(os.getenv("MEDIA_HEALTH_ALPHA", "0.3")),
+            media_breaker_threshold=int(os.getenv("MEDIA_BREAKER_THRESHOLD", "3")),
+            media_breaker_cooldown=float(os.getenv("MEDIA_BREAKER_COOLDOWN", "30")),
+            media_reupload_max_bytes=int(os.getenv("MEDIA_REUPLOAD_MAX_BYTES", "52428800")),
+            media_reupload_budget_bytes=int(os.getenv("MEDIA_REUPLOAD_BUDGET_BYTES", "209715200")),
+            media_reupload_spool_bytes=int(os.getenv("MEDIA_REUPLOAD_SPOOL_BYTES", "8388608")),
+            media_max_bytes=int(os.getenv("MEDIA_MAX_BYTES", "20971520")),
+            media_probe_sizes=_env_bool("MEDIA_PROBE_SIZES"),
+            media_probe_timeout=float(os.getenv("MEDIA_PROBE_TIMEOUT", "3")),
+            media_workers=int(os.getenv("MEDIA_WORKERS", "4")),
+            media_queue_size=int(os.getenv("MEDIA_QUEUE_SIZE", "100")),
+            media_queue_put_timeout=float(os.getenv("MEDIA_QUEUE_PUT_TIMEOUT", "2")),
+            media_drain_timeout=float(os.getenv("MEDIA_DRAIN_TIMEOUT", "30")),
+            media_retry_interval=float(os.getenv("MEDIA_RETRY_INTERVAL", "30")),
+            media_retry_batch=int(os.getenv("MEDIA_RETRY_BATCH", "5")),
+            media_retry_max_attempts=int(os.getenv("MEDIA_RETRY_MAX_ATTEMPTS", "5")),
+            media_retry_base_delay=float(os.getenv("MEDIA_RETRY_BASE_DELAY", "60")),
+            media_retry_max_delay=float(os.getenv("MEDIA_RETRY_MAX_DELAY", "1800")),
+            media_transcode=_env_bool("MEDIA_TRANSCODE"),
+            media_transcode_workers=int(os.getenv("MEDIA_TRANSCODE_WORKERS", "1")),
+            media_transcode_queue_size=int(os.getenv("MEDIA_TRANSCODE_QUEUE_SIZE", "4")),
+            media_transcode_cpu_seconds=int(os.getenv("MEDIA_TRANSCODE_CPU_SECONDS", "120")),
+            media_transcode_threads=int(os.getenv("MEDIA_TRANSCODE_THREADS", "2")),
+            media_transcode_timeout=float(os.getenv("MEDIA_TRANSCODE_TIMEOUT", "300")),
+            media_transcode_max_height=int(os.getenv("MEDIA_TRANSCODE_MAX_HEIGHT", "720")),
         )
 
     def require(self) -> "Settings":
         missing = []
         if not self.telegram_bot_token:
             missing.append("TOKEN")
-        if not self.tiktok_api_key:
-            missing.append("TIKTOK_KEY")
-        if not self.instagram_api_key:
-            missing.append("INSTAGRAM_KEY")
         if not self.gemini_api_key:
             missing.append("GEMINI_API_KEY")
         if not self.bot_name: